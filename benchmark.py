@@ -0,0 +1,173 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from typing import Callable, Optional
+
+from updater.controller import UpdateController
+from updater.model import VersionInfo, DownloadSource
+from updater.view import UpdateViewOutputs
+from updater.meta import __version__
+
+PRODUCT = "Benchmark"
+RECENT_INDEX_LENGTH = 15
+
+
+class FileSystemCounter:
+    _FS_EVENTS = {"open", "os.listdir", "os.scandir", "os.remove", "os.rename", "os.mkdir", "os.chmod", "shutil.rmtree"}
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.calls: int = 0
+        self.files: set[str] = set()
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event: str, args: tuple):
+        if self.enabled and event in self._FS_EVENTS:
+            self.calls += 1
+            if event == "open" and isinstance(args[0], str):
+                self.files.add(args[0])
+
+    @contextlib.contextmanager
+    def count(self):
+        self.calls, self.files, self.enabled = 0, set(), True
+        try:
+            yield
+        finally:
+            self.enabled = False
+
+
+def _version_info(version_code: int, changelog_length: int, sources: int) -> VersionInfo:
+    return VersionInfo(
+        version_code=version_code,
+        version_name=f"{version_code // 10000}.{version_code // 100 % 100}.{version_code % 100}",
+        force_update=version_code % 97 == 0,
+        change_log="x" * changelog_length,
+        download_source=tuple(DownloadSource(f"Source {i}", f"https://example.com/{i}/{version_code}.apk", i == 0) for i in range(sources)),
+    )
+
+
+def generate_tree(source_root: str, versions: int, changelog_length: int, sources: int, extra_products: int):
+    versions_dir = os.path.join(source_root, PRODUCT, "Version")
+    os.makedirs(versions_dir)
+    for code in range(1, versions + 1):
+        with open(os.path.join(versions_dir, str(code)), "w", encoding="utf-8") as f:
+            json.dump(_version_info(code, changelog_length, sources).to_dict(), f)
+    for i in range(extra_products):
+        os.makedirs(os.path.join(source_root, f"Product{i}"))
+
+
+def _operations(source_root: str, versions: int, changelog_length: int, sources: int) -> list[tuple[str, Callable[[], None], Optional[Callable[[], None]]]]:
+    new_version = _version_info(versions + 1, changelog_length, sources)
+
+    def _controller() -> UpdateController:
+        return UpdateController(PRODUCT, source_root, RECENT_INDEX_LENGTH)
+
+    def _drop_caches():
+        shutil.rmtree(os.path.join(source_root, PRODUCT, ".cache"), ignore_errors=True)
+
+    def _show_versions():
+        with contextlib.redirect_stdout(io.StringIO()):
+            UpdateViewOutputs.show_versions(_controller().get_versions())
+
+    return [
+        ("refresh_index_cold", lambda: _controller().refresh_index(), _drop_caches),
+        ("refresh_index", lambda: _controller().refresh_index(), None),
+        ("refresh_latest", lambda: _controller().refresh_latest(), None),
+        ("add_version", lambda: _controller().add_version(new_version, False), None),
+        ("delete_version", lambda: _controller().delete_version(new_version.version_code), None),
+        ("get_products", lambda: UpdateController.get_products(source_root), None),
+        ("product_summaries", lambda: UpdateController.get_product_summaries(source_root), None),
+        ("show_versions", _show_versions, None),
+    ]
+
+
+def run_benchmark(counter: FileSystemCounter, versions: int, changelog_length: int, sources: int, extra_products: int) -> list[dict]:
+    source_root = tempfile.mkdtemp(prefix="update-benchmark-")
+    try:
+        start = time.perf_counter()
+        generate_tree(source_root, versions, changelog_length, sources, extra_products)
+        print(f"Generated {versions} versions in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        operations = _operations(source_root, versions, changelog_length, sources)
+        results = []
+        for name, operation, setup in operations:
+            if setup is not None:
+                setup()
+            with contextlib.redirect_stdout(io.StringIO()), counter.count():
+                start = time.perf_counter()
+                operation()
+                wall_time = time.perf_counter() - start
+            results.append({"versions": versions, "operation": name, "wall_time": wall_time, "fs_calls": counter.calls, "files_opened": len(counter.files)})
+        # Peak memory is measured in a second pass because tracemalloc distorts the timings
+        for (name, operation, setup), result in zip(operations, results):
+            if setup is not None:
+                setup()
+            tracemalloc.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                operation()
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{versions:>9} {name:<20} {result['wall_time'] * 1000:10.2f} ms {result['fs_calls']:>9} fs calls", file=sys.stderr)
+        return results
+    finally:
+        shutil.rmtree(source_root, ignore_errors=True)
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> bool:
+    baseline_times = {(i["versions"], i["operation"]): i["wall_time"] for i in baseline["results"]}
+    passed = True
+    for result in current["results"]:
+        old_time = baseline_times.get((result["versions"], result["operation"]))
+        if old_time is None or old_time <= 0:
+            continue
+        ratio = result["wall_time"] / old_time
+        regressed = ratio > threshold
+        passed = passed and not regressed
+        print(f"{result['versions']:>9} {result['operation']:<20} x{ratio:6.2f}{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return passed
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Update generator benchmark")
+    parser.add_argument("-n", "--versions", help="Synthetic version counts", nargs="+", type=int, default=[1000], dest="versions")
+    parser.add_argument("--changelog-length", help="Change log length of each version", type=int, default=1000, dest="changelog_length")
+    parser.add_argument("--sources", help="Download sources of each version", type=int, default=2, dest="sources")
+    parser.add_argument("--extra-products", help="Empty products to add for get_products", type=int, default=100, dest="extra_products")
+    parser.add_argument("-o", "--output", help="Output json (default stdout)", type=str, default=None, dest="output")
+    parser.add_argument("--compare", help="Baseline json to compare wall times with", type=str, default=None, dest="compare")
+    parser.add_argument("--threshold", help="Slowdown ratio counted as regression", type=float, default=1.2, dest="threshold")
+    return parser.parse_args(args)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    counter = FileSystemCounter()
+    results = []
+    for versions in args.versions:
+        results.extend(run_benchmark(counter, versions, args.changelog_length, args.sources, args.extra_products))
+    report = {
+        "meta": {"version": __version__, "python": platform.python_version(), "platform": platform.platform(), "time": time.time()},
+        "config": {"changelog_length": args.changelog_length, "sources": args.sources, "extra_products": args.extra_products},
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            if not compare_results(json.load(f), report, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
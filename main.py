@@ -1,30 +1,57 @@
 import os
 import sys
-
-from updater import UpdateCommandController, UpdateInteractiveController
+import json
+import socket
 
 WORK_DIR = os.path.realpath(os.path.dirname(__file__))
 SOURCE_ROOT = os.path.join(WORK_DIR, "Updates")
 NEW_VERSIONS_ROOT = os.path.join(WORK_DIR, "NewVersions")
+DAEMON_SOCKET = os.path.join(SOURCE_ROOT, ".daemon.sock")
 RECENT_INDEX_LENGTH = 15
+# Commands that hold the process themselves are never forwarded to the daemon
+LOCAL_COMMANDS = {"daemon", "watch", "serve"}
 
 
 def interactive_start_menu():
+    from updater import OutputConfig, UpdateInteractiveController
+
     UpdateInteractiveController.show_banner()
     product = UpdateInteractiveController.get_product(SOURCE_ROOT)
     if product is not None:
-        controller = UpdateInteractiveController(product, SOURCE_ROOT, RECENT_INDEX_LENGTH, NEW_VERSIONS_ROOT)
+        controller = UpdateInteractiveController(product, SOURCE_ROOT, RECENT_INDEX_LENGTH, NEW_VERSIONS_ROOT, OutputConfig())
         controller.launch_interactive_menu()
 
 
 def command_control_handler(argv: list[str]):
-    controller = UpdateCommandController(SOURCE_ROOT, RECENT_INDEX_LENGTH)
+    from updater import OutputConfig, UpdateCommandController
+
+    controller = UpdateCommandController(SOURCE_ROOT, RECENT_INDEX_LENGTH, OutputConfig(), NEW_VERSIONS_ROOT, DAEMON_SOCKET)
     controller.execute_commands(argv)
 
 
+def forward_to_daemon(argv: list[str]) -> bool:
+    if not hasattr(socket, "AF_UNIX") or not LOCAL_COMMANDS.isdisjoint(argv):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(DAEMON_SOCKET)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+        client.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode("utf-8"))
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := client.recv(65536):
+            chunks.append(chunk)
+    response = json.loads(b"".join(chunks))
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    sys.exit(response["code"])
+
+
 def main():
     if len(sys.argv) > 1:
-        command_control_handler(sys.argv[1:])
+        if not forward_to_daemon(sys.argv[1:]):
+            command_control_handler(sys.argv[1:])
     else:
         interactive_start_menu()
 
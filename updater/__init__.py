@@ -1 +1,2 @@
 from .controller import UpdateCommandController, UpdateInteractiveController  # noqa: F401
+from .config import OutputConfig  # noqa: F401
@@ -0,0 +1,188 @@
+import struct
+import zipfile
+from dataclasses import dataclass, replace
+from typing import BinaryIO, Optional, Union
+
+from .cache import FileStatCache
+from .model import VersionCompat, VersionInfo
+
+_MANIFEST_ENTRY = "AndroidManifest.xml"
+
+_RES_XML_TYPE = 0x0003
+_RES_STRING_POOL_TYPE = 0x0001
+_RES_XML_RESOURCE_MAP_TYPE = 0x0180
+_RES_XML_START_ELEMENT_TYPE = 0x0102
+_UTF8_FLAG = 1 << 8
+
+_TYPE_STRING = 0x03
+_TYPE_INT_DEC = 0x10
+_TYPE_INT_HEX = 0x11
+
+_ATTR_VERSION_CODE = 0x0101021B
+_ATTR_VERSION_NAME = 0x0101021C
+_ATTR_MIN_SDK_VERSION = 0x0101020C
+_ATTR_IDS = {"versionCode": _ATTR_VERSION_CODE, "versionName": _ATTR_VERSION_NAME, "minSdkVersion": _ATTR_MIN_SDK_VERSION}
+
+
+class ApkError(ValueError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class ApkManifest:
+    package: str
+    version_code: int
+    version_name: Optional[str]
+    min_sdk: Optional[int]
+    abis: tuple[str, ...]
+
+    def to_dict(self) -> dict[str, any]:
+        return {"package": self.package, "versionCode": self.version_code, "versionName": self.version_name, "minSdk": self.min_sdk, "abis": list(self.abis)}
+
+    @staticmethod
+    def from_dict(data: dict) -> "ApkManifest":
+        return ApkManifest(data["package"], data["versionCode"], data["versionName"], data["minSdk"], tuple(data["abis"]))
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ApkError("truncated binary manifest")
+    return data
+
+
+def _decode_string_pool(chunk: bytes) -> list[str]:
+    string_count, _, flags, strings_start = struct.unpack_from("<IIII", chunk, 8)
+    header_size = struct.unpack_from("<H", chunk, 2)[0]
+    offsets = struct.unpack_from(f"<{string_count}I", chunk, header_size)
+    strings = []
+    for offset in offsets:
+        position = strings_start + offset
+        if flags & _UTF8_FLAG:
+            # UTF-16 length then UTF-8 byte length, each one or two bytes long
+            position += 2 if chunk[position] & 0x80 else 1
+            length = chunk[position]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | chunk[position + 1]
+                position += 1
+            position += 1
+            strings.append(chunk[position : position + length].decode("utf-8", errors="replace"))
+        else:
+            length = struct.unpack_from("<H", chunk, position)[0]
+            position += 2
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | struct.unpack_from("<H", chunk, position)[0]
+                position += 2
+            strings.append(chunk[position : position + length * 2].decode("utf-16-le", errors="replace"))
+    return strings
+
+
+def _element_attributes(chunk: bytes, strings: list[str], resource_ids: list[int]) -> tuple[str, dict[Union[int, str], tuple[int, int, int]]]:
+    header_size = struct.unpack_from("<H", chunk, 2)[0]
+    _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from("<IIHHH", chunk, header_size)
+    attributes = {}
+    for i in range(attribute_count):
+        position = header_size + attribute_start + i * attribute_size
+        _, attribute_name, raw_value, _, _, data_type, data = struct.unpack_from("<IIIHBBI", chunk, position)
+        if attribute_name < len(resource_ids) and resource_ids[attribute_name] != 0:
+            key = resource_ids[attribute_name]
+        else:
+            # Attributes like package have no resource id, and obfuscated manifests may drop it, so fall back to the name
+            name_text = strings[attribute_name] if attribute_name < len(strings) else ""
+            key = _ATTR_IDS.get(name_text, name_text)
+        attributes[key] = (raw_value, data_type, data)
+    return strings[name] if name < len(strings) else "", attributes
+
+
+def _string_at(strings: list[str], index: int) -> str:
+    if index >= len(strings):
+        raise ApkError(f"string index {index} out of range")
+    return strings[index]
+
+
+def _string_value(value: Optional[tuple[int, int, int]], strings: list[str]) -> Optional[str]:
+    if value is None:
+        return None
+    raw_value, data_type, data = value
+    if data_type == _TYPE_STRING:
+        return _string_at(strings, data)
+    if raw_value != 0xFFFFFFFF:
+        return _string_at(strings, raw_value)
+    if data_type in (_TYPE_INT_DEC, _TYPE_INT_HEX):
+        return str(data)
+    # A resource reference cannot be resolved without parsing resources.arsc
+    return None
+
+
+def _int_value(value: Optional[tuple[int, int, int]], strings: list[str]) -> Optional[int]:
+    if value is None:
+        return None
+    raw_value, data_type, data = value
+    if data_type in (_TYPE_INT_DEC, _TYPE_INT_HEX):
+        return data
+    text = _string_value(value, strings)
+    return int(text) if text is not None and text.isdigit() else None
+
+
+def parse_binary_manifest(stream: BinaryIO) -> tuple[str, Optional[int], Optional[str], Optional[int]]:
+    chunk_type, _, file_size = struct.unpack("<HHI", _read_exact(stream, 8))
+    if chunk_type != _RES_XML_TYPE:
+        raise ApkError("AndroidManifest.xml is not a binary xml")
+    strings: list[str] = []
+    resource_ids: list[int] = []
+    package, version_code, version_name, min_sdk = "", None, None, None
+    position = 8
+    # Chunks are read one at a time and parsing stops at <application>, so the rest of the manifest is never inflated
+    while position < file_size:
+        header = _read_exact(stream, 8)
+        chunk_type, _, chunk_size = struct.unpack("<HHI", header)
+        if chunk_size < 8:
+            raise ApkError("invalid binary xml chunk")
+        chunk = header + _read_exact(stream, chunk_size - 8)
+        position += chunk_size
+        if chunk_type == _RES_STRING_POOL_TYPE:
+            strings = _decode_string_pool(chunk)
+        elif chunk_type == _RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = list(struct.unpack_from(f"<{(chunk_size - 8) // 4}I", chunk, 8))
+        elif chunk_type == _RES_XML_START_ELEMENT_TYPE:
+            name, attributes = _element_attributes(chunk, strings, resource_ids)
+            if name == "manifest":
+                package = _string_value(attributes.get("package"), strings) or ""
+                version_code = _int_value(attributes.get(_ATTR_VERSION_CODE), strings)
+                version_name = _string_value(attributes.get(_ATTR_VERSION_NAME), strings)
+            elif name == "uses-sdk":
+                min_sdk = _int_value(attributes.get(_ATTR_MIN_SDK_VERSION), strings)
+                break
+            elif name == "application":
+                break
+    return package, version_code, version_name, min_sdk
+
+
+def read_apk_manifest(path: str) -> ApkManifest:
+    try:
+        # Only the central directory and the manifest entry are read from the archive
+        with zipfile.ZipFile(path) as apk:
+            abis = sorted({i.split("/")[1] for i in apk.namelist() if i.startswith("lib/") and i.count("/") >= 2 and i.split("/")[1]})
+            with apk.open(_MANIFEST_ENTRY) as stream:
+                package, version_code, version_name, min_sdk = parse_binary_manifest(stream)
+    except (zipfile.BadZipFile, KeyError, IndexError, struct.error) as e:
+        raise ApkError(f"{path}: {e}") from e
+    if version_code is None:
+        raise ApkError(f"{path}: versionCode not found in AndroidManifest.xml")
+    return ApkManifest(package, version_code, version_name, min_sdk, tuple(abis))
+
+
+def read_apk_manifests(paths: list[str], cache: FileStatCache, jobs: Optional[int] = None) -> list[Union[ApkManifest, Exception]]:
+    results = cache.resolve(paths, lambda p: read_apk_manifest(p).to_dict(), jobs)
+    return [i if isinstance(i, Exception) else ApkManifest.from_dict(i) for i in results]
+
+
+def apk_version_info(manifest: ApkManifest, template: Optional[VersionInfo] = None) -> VersionInfo:
+    version_name = manifest.version_name if manifest.version_name is not None else template.version_name if template is not None else None
+    if version_name is None:
+        raise ApkError(f"versionName of {manifest.package or 'apk'} is a resource reference, set it in a version info json")
+    if template is None or len(template.download_source) == 0:
+        # A release without download sources would be published with a null download url
+        raise ApkError(f"no download sources for {manifest.package or 'apk'}, set them in a version info json")
+    compat = VersionCompat(min_sdk=manifest.min_sdk, abis=manifest.abis, channel=template.compat.channel)
+    return replace(template, version_code=manifest.version_code, version_name=version_name, compat=compat)
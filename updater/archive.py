@@ -0,0 +1,143 @@
+import os
+import bisect
+from dataclasses import dataclass
+from typing import Optional
+
+from .model import VersionInfo, VersionIndex
+from .utils import load_json
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    keep_last: int
+    keep_forced: bool = False
+    keep_since: Optional[float] = None
+
+    def keeps(self, position: int, index: Optional[VersionIndex], mtime: Optional[float]) -> bool:
+        if position < self.keep_last:
+            return True
+        if self.keep_forced and index is not None and index.force_update:
+            return True
+        # Versions without a file to date are kept rather than archived on a guess
+        return self.keep_since is not None and (mtime is None or mtime >= self.keep_since)
+
+
+@dataclass(frozen=True)
+class ArchivePlan:
+    bundles: dict[str, dict]
+    deleted: list[str]
+    index: list[dict]
+
+
+class VersionArchive:
+    def __init__(self, archive_dir: str, index_file: str):
+        self._archive_dir: str = archive_dir
+        self._index_file: str = index_file
+        self._entries: Optional[list[dict]] = None
+        self._firsts: list[int] = []
+        self._loaded_mtime_ns: Optional[int] = None
+        self._bundle_name: Optional[str] = None
+        self._bundle: dict[int, dict] = {}
+
+    def _file_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self._index_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def revalidate(self):
+        if self._entries is not None and self._file_mtime_ns() != self._loaded_mtime_ns:
+            self._entries = None
+            self._bundle_name = None
+
+    def _load(self) -> list[dict]:
+        if self._entries is None:
+            self._loaded_mtime_ns = self._file_mtime_ns()
+            self._entries = load_json(self._index_file) if self._loaded_mtime_ns is not None else []
+            self._firsts = [i["first"] for i in self._entries]
+        return self._entries
+
+    def _entry(self, version_code: int) -> Optional[dict]:
+        entries = self._load()
+        i = bisect.bisect_right(self._firsts, version_code) - 1
+        return entries[i] if i >= 0 and version_code <= entries[i]["last"] else None
+
+    @staticmethod
+    def bundle_name(entry: dict) -> str:
+        return f"{entry['first']}-{entry['last']}"
+
+    def bundle_file(self, name: str) -> str:
+        return os.path.join(self._archive_dir, name)
+
+    def ranges(self) -> list[dict]:
+        return [{"first": i["first"], "last": i["last"], "count": len(i["versions"])} for i in self._load()]
+
+    def __contains__(self, version_code: int) -> bool:
+        entry = self._entry(version_code)
+        return entry is not None and version_code in entry["versions"]
+
+    def __len__(self) -> int:
+        return sum(len(i["versions"]) for i in self._load())
+
+    def indexes(self) -> list[VersionIndex]:
+        indexes = []
+        for entry in reversed(self._load()):
+            forced = set(entry["forceUpdate"])
+            indexes.extend(VersionIndex(version=i, force_update=i in forced) for i in reversed(entry["versions"]))
+        return indexes
+
+    def _bundle_versions(self, entry: dict) -> dict[int, dict]:
+        # Only the most recently used bundle stays in memory, lookups tend to cluster within one range
+        name = self.bundle_name(entry)
+        if self._bundle_name != name:
+            self._bundle = {i["versionCode"]: i for i in load_json(self.bundle_file(name))["versions"]}
+            self._bundle_name = name
+        return self._bundle
+
+    def get(self, version_code: int) -> Optional[VersionInfo]:
+        entry = self._entry(version_code)
+        if entry is None or version_code not in entry["versions"]:
+            return None
+        data = self._bundle_versions(entry).get(version_code)
+        return VersionInfo.from_dict(data) if data is not None else None
+
+    def plan(self, added: list[VersionInfo], removed: set[int], active_codes: set[int], bundle_size: int) -> ArchivePlan:
+        old_entries = {self.bundle_name(i): i for i in self._load()}
+        infos = {i.version_code: i for i in added}
+        archived_codes = ({v for i in old_entries.values() for v in i["versions"]} | set(infos)) - removed - active_codes
+        # A bundle covers a run of archived versions that no active version interrupts
+        runs, run = [], []
+        for version_code in sorted(archived_codes | active_codes):
+            if version_code in archived_codes:
+                run.append(version_code)
+            elif len(run) > 0:
+                runs.append(run)
+                run = []
+        if len(run) > 0:
+            runs.append(run)
+        bundles, index = {}, []
+        for run in runs:
+            for chunk in [run[i : i + bundle_size] for i in range(0, len(run), bundle_size)]:
+                old_entry = old_entries.get(f"{chunk[0]}-{chunk[-1]}")
+                if old_entry is not None and old_entry["versions"] == chunk and all(i not in infos for i in chunk):
+                    # Unchanged bundles are kept without reading them
+                    index.append(old_entry)
+                    continue
+                version_infos = [infos[i] if i in infos else self.get(i) for i in chunk]
+                version_infos = [i for i in version_infos if i is not None]
+                if len(version_infos) == 0:
+                    continue
+                entry = {
+                    "first": version_infos[0].version_code,
+                    "last": version_infos[-1].version_code,
+                    "versions": [i.version_code for i in version_infos],
+                    "forceUpdate": [i.version_code for i in version_infos if i.force_update],
+                }
+                bundles[self.bundle_name(entry)] = {"first": entry["first"], "last": entry["last"], "versions": [i.to_dict() for i in version_infos]}
+                index.append(entry)
+        live_names = {self.bundle_name(i) for i in index}
+        return ArchivePlan(bundles=bundles, deleted=[i for i in old_entries if i not in live_names], index=index)
+
+    def applied(self):
+        self._entries = None
+        self._bundle_name = None
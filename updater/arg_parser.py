@@ -1,5 +1,6 @@
 import os
 import argparse
+import datetime
 
 
 def _dir_path(path: str) -> str:
@@ -18,13 +19,42 @@ def _file_path(path: str) -> str:
         raise argparse.ArgumentTypeError(f"File: {path} is not a valid path")
 
 
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number > 0:
+        return number
+    else:
+        raise argparse.ArgumentTypeError(f"Number: {value} is not a positive integer")
+
+
+def _non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number >= 0:
+        return number
+    else:
+        raise argparse.ArgumentTypeError(f"Number: {value} is not a non-negative integer")
+
+
 def _parse_product(parser: argparse.ArgumentParser):
     parser.add_argument("-p", "--product", help="Product name", required=True, type=str, dest="product")
 
 
 def _parse_product_version(parser: argparse.ArgumentParser):
     _parse_product(parser)
-    parser.add_argument("-i", "--info", help="Version info json", required=True, type=_file_path, dest="version_info")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-i", "--info", help="Version info json", type=_file_path, dest="version_info")
+    group.add_argument("-b", "--batch", help="Dir of version info jsons", type=_dir_path, dest="batch")
+    group.add_argument("--apk", help="Apk files to read the version from", nargs="+", type=_file_path, dest="apks", metavar="APK")
+    group.add_argument("--apk-dir", help="Dir of apk files", type=_dir_path, dest="apk_dir")
+    parser.add_argument("-a", "--artifact", help="Local apk to take size and sha256 from for --info", required=False, default=None, type=_file_path, dest="artifact")
+    parser.add_argument("-t", "--template", help="Version info json for fields an apk lacks", required=False, default=None, type=_file_path, dest="template")
+    parser.add_argument("-j", "--jobs", help="Parallel workers for reading and hashing artifacts", required=False, default=None, type=_positive_int, dest="jobs")
 
 
 def _parse_new_output(parser: argparse.ArgumentParser):
@@ -47,11 +77,49 @@ def _setup_show_parser(parser: argparse.ArgumentParser):
 def _setup_refresh_parser(parser: argparse.ArgumentParser):
     sub_parsers = parser.add_subparsers(title="Refresh types", dest="refresh", required=True, metavar="<type>")
 
-    _parse_product(sub_parsers.add_parser("all", help="Refresh all"))
+    all_parser = sub_parsers.add_parser("all", help="Refresh all")
+    group = all_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-p", "--product", help="Product name", type=str, dest="product")
+    group.add_argument("--all-products", help="Refresh every product", action="store_true", dest="all_products")
+    all_parser.add_argument("-j", "--jobs", help="Parallel workers for --all-products", required=False, default=None, type=_positive_int, dest="jobs")
     _parse_product(sub_parsers.add_parser("index", help="Refresh version index"))
     _parse_product(sub_parsers.add_parser("latest", help="Refresh latest version"))
 
 
+def _parse_products(parser: argparse.ArgumentParser):
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-p", "--product", help="Product name", type=str, dest="product")
+    group.add_argument("--all-products", help="Every product", action="store_true", dest="all_products")
+
+
+def _setup_export_parser(parser: argparse.ArgumentParser):
+    _parse_products(parser)
+    parser.add_argument("--full", help="Rewrite every version file instead of changed rows only", action="store_true", dest="full")
+
+
+def _setup_reshard_parser(parser: argparse.ArgumentParser):
+    _parse_products(parser)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--shard-size", help="Versions per Version/Shard/<code // size> bucket", type=_positive_int, dest="shard_size")
+    group.add_argument("--flat", help="Move versions back to a flat Version dir", action="store_true", dest="flat")
+    parser.add_argument("--flat-links", help="Keep Version/<code> as hard links for existing clients", action="store_true", dest="flat_links")
+
+
+def _date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Date: {value} is not a valid YYYY-MM-DD date")
+
+
+def _setup_compact_parser(parser: argparse.ArgumentParser):
+    _parse_products(parser)
+    parser.add_argument("--keep-last", help="Newest versions to keep active", required=True, type=_positive_int, dest="keep_last")
+    parser.add_argument("--keep-forced", help="Keep every force update version active", action="store_true", dest="keep_forced")
+    parser.add_argument("--keep-since", help="Keep versions written on or after this date", required=False, default=None, type=_date, dest="keep_since")
+    parser.add_argument("--bundle-size", help="Versions per archive bundle", required=False, default=500, type=_positive_int, dest="bundle_size")
+
+
 def _setup_create_parser(parser: argparse.ArgumentParser):
     sub_parsers = parser.add_subparsers(title="Create types", dest="create", required=True, metavar="<type>")
 
@@ -59,8 +127,63 @@ def _setup_create_parser(parser: argparse.ArgumentParser):
     _parse_new_output(sub_parsers.add_parser("product", help="New product"))
 
 
+def _setup_watch_parser(parser: argparse.ArgumentParser):
+    parser.add_argument("-p", "--product", help="Product name (repeatable)", required=True, action="append", type=str, dest="products")
+    parser.add_argument(
+        "-t", "--templates", help="Version templates dir (one sub dir per product if several)", required=False, default=None, type=str, dest="templates"
+    )
+    parser.add_argument("--debounce", help="Seconds to wait for a burst to settle", required=False, default=1.0, type=float, dest="debounce")
+    parser.add_argument("--interval", help="Polling interval in seconds", required=False, default=1.0, type=float, dest="interval")
+    parser.add_argument("--polling", help="Poll instead of using inotify", action="store_true", dest="polling")
+    parser.add_argument("--ingest-existing", help="Ingest templates that exist at startup", action="store_true", dest="ingest_existing")
+
+
+def _setup_serve_parser(parser: argparse.ArgumentParser):
+    parser.add_argument("-p", "--product", help="Product name (repeatable, default all)", required=False, action="append", type=str, dest="products")
+    parser.add_argument("--host", help="Bind address", required=False, default="127.0.0.1", type=str, dest="host")
+    parser.add_argument("--port", help="Bind port", required=False, default=8080, type=int, dest="port")
+    parser.add_argument("--interval", help="Hot reload check interval in seconds", required=False, default=1.0, type=float, dest="interval")
+    parser.add_argument("-v", "--verbose", help="Log every request", action="store_true", dest="verbose")
+
+
 def parse_args(args: list[str]) -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Update generator command controller")
+    parser.add_argument(
+        "--precompress",
+        help="Write .gz (and .br) sidecars for served files (kept for the product, like the levels below)",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="precompress",
+    )
+    parser.add_argument("--gzip-level", help="Gzip sidecar compression level", choices=range(1, 10), type=int, dest="gzip_level", metavar="[1-9]")
+    parser.add_argument(
+        "--sync-headers",
+        help="Write .sync/_headers with ETag and Cache-Control (kept for the product)",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="sync_headers",
+    )
+    parser.add_argument(
+        "--update-answers",
+        help="Write Since/<code> update answers for every version (kept for the product)",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="update_answers",
+    )
+    parser.add_argument("--index-page-size", help="Write Version/Index as pages of this size (kept for the product, 0 for a flat index)", type=_non_negative_int, dest="index_page_size")
+    parser.add_argument("--brotli-quality", help="Brotli sidecar quality", choices=range(0, 12), type=int, dest="brotli_quality", metavar="[0-11]")
+    parser.add_argument(
+        "--slim-versions",
+        help="Write change logs as shared blobs referenced from version files (kept for the product)",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="slim_versions",
+    )
+    parser.add_argument("--storage", help="Version storage backend (kept for the product, switch with migrate)", choices=["files", "sqlite"], type=str, dest="storage")
+    parser.add_argument("--profile", help="Print I/O timings and counts to stderr", action="store_true", dest="profile")
+    parser.add_argument("--profile-output", help="Write the I/O profile summary as json", type=str, dest="profile_output", metavar="FILE")
+    parser.add_argument("--trace", help="Write a Chrome trace of I/O and controller calls", type=str, dest="trace", metavar="FILE")
+    parser.add_argument("--cprofile", help="Run under cProfile and dump its stats", type=str, dest="cprofile", metavar="FILE")
 
     sub_parsers = parser.add_subparsers(title="Commands", dest="command", required=True, metavar="<command>")
 
@@ -70,7 +193,15 @@ def parse_args(args: list[str]) -> argparse.ArgumentParser:
     _parse_product_version(sub_parsers.add_parser("replace", help="Replace version"))
     _setup_delete_version_parser(sub_parsers.add_parser("delete", help="Delete version"))
     _setup_refresh_parser(sub_parsers.add_parser("refresh", help="Refresh version index and latest info"))
-
+    _setup_export_parser(sub_parsers.add_parser("export", help="Export stored versions to the static layout"))
+    _parse_products(sub_parsers.add_parser("migrate", help="Import version files into the sqlite storage"))
+    _setup_reshard_parser(sub_parsers.add_parser("reshard", help="Move version files to a sharded or flat layout"))
+    _setup_compact_parser(sub_parsers.add_parser("compact", help="Archive versions outside a retention policy into bundles"))
+
+    _setup_watch_parser(sub_parsers.add_parser("watch", help="Watch version templates and ingest them"))
+    _setup_serve_parser(sub_parsers.add_parser("serve", help="Serve updates over HTTP from memory"))
+    daemon_parser = sub_parsers.add_parser("daemon", help="Run a resident daemon that executes forwarded commands")
+    daemon_parser.add_argument("-s", "--socket", help="Unix socket path", required=False, default=None, type=str, dest="socket")
     sub_parsers.add_parser("about", help="About", add_help=False)
 
     return parser.parse_args(args)
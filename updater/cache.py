@@ -0,0 +1,161 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Union
+
+from .changelog import change_log_hash
+from .model import VersionInfo, VersionIndex, VersionCompat
+from .utils import load_json, dump_json, prepare_parent_dir
+
+
+class VersionMetaCache:
+    _FORMAT_VERSION = 2
+
+    def __init__(self, path: str):
+        self._path: str = path
+        self._entries: Optional[dict[str, dict]] = None
+        self._dirty: bool = False
+        self._loaded_mtime_ns: Optional[int] = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _file_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def revalidate(self):
+        if self._entries is not None and not self._dirty and self._file_mtime_ns() != self._loaded_mtime_ns:
+            self._entries = None
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            self._entries = {}
+            self._loaded_mtime_ns = self._file_mtime_ns()
+            if self._loaded_mtime_ns is not None:
+                try:
+                    data = load_json(self._path)
+                except (OSError, ValueError):
+                    data = None
+                if isinstance(data, dict) and data.get("format") == self._FORMAT_VERSION:
+                    self._entries = data.get("versions", {})
+        return self._entries
+
+    @staticmethod
+    def _stat_key(stat: os.stat_result) -> list[int]:
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, version_code: int, stat: os.stat_result) -> Optional[dict]:
+        entry = self._load().get(str(version_code))
+        if entry is not None and entry["stat"] == self._stat_key(stat):
+            return entry
+        return None
+
+    def get_index(self, version_code: int, stat: os.stat_result) -> Optional[VersionIndex]:
+        entry = self.get(version_code, stat)
+        return VersionIndex(version=version_code, force_update=entry["forceUpdate"]) if entry is not None else None
+
+    def get_compat(self, version_code: int, stat: os.stat_result) -> Optional[VersionCompat]:
+        entry = self.get(version_code, stat)
+        return VersionCompat.from_dict(entry["compat"]) if entry is not None and "compat" in entry else None
+
+    def put_meta(self, index: VersionIndex, version_name: str, change_log_hash: Optional[str], compat: VersionCompat, stat: os.stat_result):
+        self._load()[str(index.version)] = {
+            "stat": self._stat_key(stat),
+            "versionName": version_name,
+            "forceUpdate": index.force_update,
+            "changeLogHash": change_log_hash,
+            "compat": compat.to_dict(),
+        }
+        self._dirty = True
+
+    def put(self, info: VersionInfo, stat: os.stat_result, slim: bool):
+        # Only slim version files reference a change log blob
+        self.put_meta(info.to_index(), info.version_name, change_log_hash(info.change_log) if slim else None, info.compat, stat)
+
+    def remove(self, version_code: int):
+        if self._load().pop(str(version_code), None) is not None:
+            self._dirty = True
+
+    def retain(self, version_codes: list[int]):
+        entries = self._load()
+        stale = entries.keys() - {str(i) for i in version_codes}
+        for key in stale:
+            del entries[key]
+        if len(stale) > 0:
+            self._dirty = True
+
+    def save(self):
+        if self._dirty:
+            prepare_parent_dir(self._path)
+            dump_json(self._path, {"format": self._FORMAT_VERSION, "versions": self._load()})
+            self._loaded_mtime_ns = self._file_mtime_ns()
+            self._dirty = False
+
+
+class FileStatCache:
+    _FORMAT_VERSION = 1
+
+    def __init__(self, path: str):
+        self._path: str = path
+        self._entries: Optional[dict[str, dict]] = None
+        self._dirty: bool = False
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.isfile(self._path):
+                try:
+                    data = load_json(self._path)
+                except (OSError, ValueError):
+                    data = None
+                if isinstance(data, dict) and data.get("format") == self._FORMAT_VERSION:
+                    self._entries = data.get("files", {})
+        return self._entries
+
+    @staticmethod
+    def _stat_key(stat: os.stat_result) -> list[int]:
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[dict]:
+        entry = self._load().get(os.path.abspath(path))
+        if entry is not None and entry["stat"] == self._stat_key(stat):
+            return entry["value"]
+        return None
+
+    def put(self, path: str, stat: os.stat_result, value: dict):
+        self._load()[os.path.abspath(path)] = {"stat": self._stat_key(stat), "value": value}
+        self._dirty = True
+
+    def save(self):
+        if self._dirty:
+            prepare_parent_dir(self._path)
+            dump_json(self._path, {"format": self._FORMAT_VERSION, "files": self._load()})
+            self._dirty = False
+
+    def resolve(self, paths: list[str], compute: Callable[[str], dict], jobs: Optional[int] = None) -> list[Union[dict, Exception]]:
+        results: list[Union[dict, Exception, None]] = [None] * len(paths)
+        missing: list[tuple[int, os.stat_result]] = []
+        for i, path in enumerate(paths):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                results[i] = e
+                continue
+            results[i] = self.get(path, stat)
+            if results[i] is None:
+                missing.append((i, stat))
+        if len(missing) > 0:
+            # Inflating and hashing release the GIL, so threads overlap the reads without process start-up costs
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [(i, stat, executor.submit(compute, paths[i])) for i, stat in missing]
+                for i, stat, future in futures:
+                    try:
+                        results[i] = future.result()
+                        self.put(paths[i], stat, results[i])
+                    except (OSError, ValueError) as e:
+                        results[i] = e
+            self.save()
+        return results
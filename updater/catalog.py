@@ -0,0 +1,214 @@
+import os
+import bisect
+from typing import Iterator, Optional
+
+
+class VersionCatalog:
+    def __init__(self, folder_path: str):
+        self._folder_path: str = folder_path
+        self._mtime_ns: Optional[int] = None
+        self._loaded: bool = False
+        self._versions: list[int] = []
+        self._version_set: set[int] = set()
+
+    def _folder_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self._folder_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _scan(self) -> list[int]:
+        if self._mtime_ns is None:
+            return []
+        with os.scandir(self._folder_path) as entries:
+            return sorted(int(i.name) for i in entries if i.name.isdigit() and i.is_file())
+
+    def _ensure_loaded(self):
+        mtime_ns = self._folder_mtime_ns()
+        if not self._loaded or mtime_ns != self._mtime_ns:
+            self._mtime_ns = mtime_ns
+            self._versions = self._scan()
+            self._version_set = set(self._versions)
+            self._loaded = True
+
+    def invalidate(self):
+        self._loaded = False
+
+    def stamp(self, path: str) -> Optional[tuple]:
+        return (self._folder_mtime_ns(),) if os.path.dirname(path) == self._folder_path else None
+
+    def sync(self, stamp: Optional[tuple]):
+        if stamp is None or not self._loaded:
+            return
+        # Only our own write happened since the last scan if the folder still had the recorded mtime right before it
+        if stamp[0] == self._mtime_ns:
+            self._mtime_ns = self._folder_mtime_ns()
+        else:
+            self._loaded = False
+
+    def add(self, version_code: int):
+        if self._loaded and version_code not in self._version_set:
+            bisect.insort(self._versions, version_code)
+            self._version_set.add(version_code)
+
+    def remove(self, version_code: int):
+        if self._loaded and version_code in self._version_set:
+            del self._versions[bisect.bisect_left(self._versions, version_code)]
+            self._version_set.remove(version_code)
+
+    def versions(self, descending: bool = True) -> list[int]:
+        self._ensure_loaded()
+        return self._versions[::-1] if descending else self._versions[:]
+
+    def top(self, num: int) -> list[int]:
+        self._ensure_loaded()
+        return self._versions[: -num - 1 : -1] if num > 0 else []
+
+    def newer_count(self, version_code: int) -> int:
+        self._ensure_loaded()
+        return len(self._versions) - bisect.bisect_right(self._versions, version_code)
+
+    def pages(self, page_size: int) -> Iterator[list[int]]:
+        self._ensure_loaded()
+        for i in range(0, len(self._versions), page_size):
+            yield self._versions[i : i + page_size]
+
+    def latest(self) -> Optional[int]:
+        self._ensure_loaded()
+        return self._versions[-1] if len(self._versions) > 0 else None
+
+    def __contains__(self, version_code: int) -> bool:
+        self._ensure_loaded()
+        return version_code in self._version_set
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._versions)
+
+
+class ShardedVersionCatalog:
+    def __init__(self, shards_path: str, shard_size: int):
+        self._shards_path: str = shards_path
+        self._shard_size: int = shard_size
+        self._mtime_ns: Optional[int] = None
+        self._buckets: Optional[list[int]] = None
+        self._bucket_versions: dict[int, list[int]] = {}
+        self._bucket_mtimes: dict[int, Optional[int]] = {}
+
+    @staticmethod
+    def _folder_mtime_ns(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _bucket_path(self, bucket: int) -> str:
+        return os.path.join(self._shards_path, str(bucket))
+
+    def _ensure_buckets(self) -> list[int]:
+        mtime_ns = self._folder_mtime_ns(self._shards_path)
+        if self._buckets is None or mtime_ns != self._mtime_ns:
+            self._mtime_ns = mtime_ns
+            self._buckets = []
+            if mtime_ns is not None:
+                with os.scandir(self._shards_path) as entries:
+                    self._buckets = sorted(int(i.name) for i in entries if i.name.isdigit() and i.is_dir())
+            live_buckets = set(self._buckets)
+            for bucket in [i for i in self._bucket_versions if i not in live_buckets]:
+                del self._bucket_versions[bucket], self._bucket_mtimes[bucket]
+        return self._buckets
+
+    def _bucket(self, bucket: int) -> list[int]:
+        # Buckets are only scanned when a query reaches them, so latest and recent lookups stay in the top ones
+        mtime_ns = self._folder_mtime_ns(self._bucket_path(bucket))
+        versions = self._bucket_versions.get(bucket)
+        if versions is None or mtime_ns != self._bucket_mtimes[bucket]:
+            versions = []
+            if mtime_ns is not None:
+                with os.scandir(self._bucket_path(bucket)) as entries:
+                    versions = sorted(int(i.name) for i in entries if i.name.isdigit() and i.is_file())
+            self._bucket_versions[bucket] = versions
+            self._bucket_mtimes[bucket] = mtime_ns
+        return versions
+
+    def invalidate(self):
+        self._buckets = None
+        self._bucket_versions.clear()
+        self._bucket_mtimes.clear()
+
+    def stamp(self, path: str) -> Optional[tuple]:
+        bucket_path = os.path.dirname(path)
+        if os.path.dirname(bucket_path) != self._shards_path or not os.path.basename(bucket_path).isdigit():
+            return None
+        return int(os.path.basename(bucket_path)), self._folder_mtime_ns(self._shards_path), self._folder_mtime_ns(bucket_path)
+
+    def sync(self, stamp: Optional[tuple]):
+        if stamp is None:
+            return
+        bucket, shards_mtime_ns, bucket_mtime_ns = stamp
+        if self._buckets is not None:
+            if shards_mtime_ns == self._mtime_ns:
+                self._mtime_ns = self._folder_mtime_ns(self._shards_path)
+            else:
+                self._buckets = None
+        if bucket in self._bucket_versions:
+            if bucket_mtime_ns == self._bucket_mtimes[bucket]:
+                self._bucket_mtimes[bucket] = self._folder_mtime_ns(self._bucket_path(bucket))
+            else:
+                del self._bucket_versions[bucket], self._bucket_mtimes[bucket]
+
+    def add(self, version_code: int):
+        bucket = version_code // self._shard_size
+        if self._buckets is not None and bucket not in self._buckets:
+            bisect.insort(self._buckets, bucket)
+        versions = self._bucket_versions.get(bucket)
+        if versions is not None and version_code not in versions:
+            bisect.insort(versions, version_code)
+
+    def remove(self, version_code: int):
+        bucket = version_code // self._shard_size
+        versions = self._bucket_versions.get(bucket)
+        if versions is not None and version_code in versions:
+            versions.remove(version_code)
+
+    def versions(self, descending: bool = True) -> list[int]:
+        versions = [v for i in self._ensure_buckets() for v in self._bucket(i)]
+        return versions[::-1] if descending else versions
+
+    def top(self, num: int) -> list[int]:
+        versions = []
+        for bucket in reversed(self._ensure_buckets()):
+            if len(versions) >= num:
+                break
+            versions.extend(self._bucket(bucket)[: -num + len(versions) - 1 : -1])
+        return versions
+
+    def newer_count(self, version_code: int) -> int:
+        bucket = version_code // self._shard_size
+        count = 0
+        for i in reversed(self._ensure_buckets()):
+            if i < bucket:
+                break
+            versions = self._bucket(i)
+            count += len(versions) if i > bucket else len(versions) - bisect.bisect_right(versions, version_code)
+        return count
+
+    def pages(self, page_size: int) -> Iterator[list[int]]:
+        versions = self.versions(descending=False)
+        for i in range(0, len(versions), page_size):
+            yield versions[i : i + page_size]
+
+    def latest(self) -> Optional[int]:
+        top = self.top(1)
+        return top[0] if len(top) > 0 else None
+
+    def __contains__(self, version_code: int) -> bool:
+        bucket = version_code // self._shard_size
+        if bucket not in self._ensure_buckets():
+            return False
+        versions = self._bucket(bucket)
+        i = bisect.bisect_left(versions, version_code)
+        return i < len(versions) and versions[i] == version_code
+
+    def __len__(self) -> int:
+        return sum(len(self._bucket(i)) for i in self._ensure_buckets())
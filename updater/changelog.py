@@ -0,0 +1,11 @@
+import hashlib
+
+from .utils import serialize_json
+
+
+def change_log_blob(change_log: str) -> bytes:
+    return serialize_json({"changeLog": change_log})
+
+
+def change_log_hash(change_log: str) -> str:
+    return hashlib.sha256(change_log_blob(change_log)).hexdigest()
@@ -0,0 +1,32 @@
+import os
+import mmap
+import hashlib
+from typing import Optional, Union
+
+from .cache import FileStatCache
+from .profiler import profiled
+
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+@profiled("hash", size=lambda result, *_: result[0])
+def file_checksum(path: str) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > 0:
+            # Slices of the mapping are hashed without copying and hashlib drops the GIL for each one
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for offset in range(0, size, _CHUNK_SIZE):
+                    digest.update(view[offset : offset + _CHUNK_SIZE])
+    return size, digest.hexdigest()
+
+
+def _checksum_entry(path: str) -> dict:
+    size, sha256 = file_checksum(path)
+    return {"size": size, "sha256": sha256}
+
+
+def compute_checksums(paths: list[str], cache: FileStatCache, jobs: Optional[int] = None) -> list[Union[tuple[int, str], Exception]]:
+    results = cache.resolve(paths, _checksum_entry, jobs)
+    return [i if isinstance(i, Exception) else (i["size"], i["sha256"]) for i in results]
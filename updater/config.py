@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class OutputConfig:
+    precompress: Optional[bool] = None
+    gzip_level: Optional[int] = None
+    brotli_quality: Optional[int] = None
+    version_index_page_size: Optional[int] = None
+    sync_headers: Optional[bool] = None
+    update_answers: Optional[bool] = None
+    storage: Optional[str] = None
+    slim_versions: Optional[bool] = None
@@ -1,19 +1,40 @@
 import os
 import sys
+import time
+import signal
 import argparse
-from typing import Callable, Optional
+import datetime
+import cProfile
+import dataclasses
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Optional, Union
 
 from .io import UpdateFileManager
-from .model import VersionInfo
+from .archive import RetentionPolicy
+from .layout import VersionLayout
+from .products import ProductCatalog, empty_product_summary
+from .config import OutputConfig
+from .model import KNOWN_ABIS, DEFAULT_CHANNEL, VersionInfo, VersionIndex
 from .view import UpdateViewMenus, UpdateViewInputs, UpdateViewOutputs
 from .arg_parser import parse_args
+from .watcher import create_folder_watcher
+from .server import UpdateServer, UpdateSnapshot
+from .daemon import UpdateDaemon
+from .profiler import IOProfiler
+
+
+def _refresh_product(product: str, source_root: str, recent_index_length: int, config: Optional[OutputConfig]):
+    UpdateController(product, source_root, recent_index_length, config).refresh_all()
 
 
 class UpdateController:
-    def __init__(self, product: str, source_root: str, recent_index_length: int):
+    def __init__(self, product: str, source_root: str, recent_index_length: int, config: Optional[OutputConfig] = None):
         self._product: str = product
         self._recent_index_length: int = recent_index_length
-        self._files: UpdateFileManager = UpdateFileManager(source_root, product)
+        self._files: UpdateFileManager = UpdateFileManager(source_root, product, config)
+        self._products: ProductCatalog = ProductCatalog(source_root, config.sync_headers if config is not None else None)
+        if self._files.journal.has_entries():
+            self.recover()
 
     @property
     def product(self) -> str:
@@ -47,6 +68,9 @@ class UpdateController:
     def create_product(source_root: str, name: str, validate: bool = True) -> Optional[str]:
         if not validate or UpdateController.get_file_exists_validator(source_root)(name):
             UpdateFileManager.new_product(source_root, name)
+            catalog = ProductCatalog(source_root)
+            if catalog.exists():
+                catalog.update(name, empty_product_summary())
             UpdateViewOutputs.new_product_created(name)
             return name
         else:
@@ -65,30 +89,240 @@ class UpdateController:
     def is_product_exists(source_root: str, product: str) -> bool:
         return UpdateFileManager.has_product(source_root, product)
 
-    def refresh_index(self):
+    def _refresh_index(self) -> int:
+        self._files.rescan_version_codes()
+        version_codes = self._files.list_version_codes()
+        changed = self._files.export_version_files()
+        changed += self._files.save_version_index_file()
+        version_indexes = [self._files.read_version_code_index(i) for i in version_codes[: self._recent_index_length]]
+        changed += self._files.save_recent_index_list([i for i in version_indexes if i is not None])
+        self._files.retain_cached_version_codes(version_codes)
+        changed += self._files.sync_version_files(version_codes)
+        changed += self._files.sync_change_logs(version_codes)
+        changed += self._refresh_update_answers()
+        return changed
+
+    def _refresh_update_answers(self) -> int:
+        if not self._files.writes_update_answers():
+            return self._files.delete_update_answers()
+        answers = {}
+        latest_version_code = self._files.get_latest_version_code()
+        force_update = False
+        archived_indexes = self._files.list_archived_version_indexes()
+        archived = {i.version: i for i in archived_indexes}
         version_codes = self._files.list_version_codes()
-        self._files.save_version_index_file(version_codes)
-        versions = [self._files.read_version_code_version_info(i) for i in version_codes[: self._recent_index_length]]
-        version_indexes = [i.to_index() for i in versions if i is not None]
-        self._files.save_recent_index_list(version_indexes)
+        if len(archived) > 0:
+            # Clients still running an archived version keep getting answers
+            version_codes = sorted(set(version_codes).union(archived), reverse=True)
+        # Descending sweep: each answer covers the versions newer than the one being visited
+        for version_code in version_codes:
+            answers[version_code] = {"updateAvailable": version_code != latest_version_code, "latestVersion": latest_version_code, "forceUpdate": force_update}
+            version_index = archived[version_code] if self._files.is_archived(version_code) else self._files.read_version_code_index(version_code)
+            force_update = force_update or (version_index is not None and version_index.force_update)
+        return self._files.save_update_answers(answers)
+
+    def _version_exists(self, version_code: int) -> bool:
+        return self._files.has_version_code(version_code) or self._files.is_archived(version_code)
+
+    def _replay(self, entry: dict) -> bool:
+        if entry["op"] == "save":
+            try:
+                version_info = VersionInfo.from_dict(entry["version"])
+            except ValueError:
+                return False
+            # Checks made before the lock are repeated here, so the later of two racing adds loses instead of overwriting
+            if entry.get("exclusive") and self._version_exists(version_info.version_code):
+                return False
+            if entry.get("requireLatest") and self.is_adding_old_version(version_info):
+                return False
+            self._files.save_version_code_version_info(version_info)
+        else:
+            self._files.delete_version_code_version_info(entry["code"])
+        return True
+
+    @staticmethod
+    def _save_operation(version_info: VersionInfo, exclusive: bool) -> dict:
+        operation = {"op": "save", "version": version_info.to_dict()}
+        if exclusive:
+            operation["exclusive"] = True
+        return operation
+
+    def _run_journaled(self, operations: list[dict], refresh: Callable[[], int]) -> int:
+        ids = self._files.journal.append(operations)
+        with self._files.lock:
+            if self._files.lock.stale:
+                self._files.revalidate()
+            entries = self._files.journal.pending()
+            if len(ids) > 0 and ids.isdisjoint(i["id"] for i in entries):
+                # A writer holding the lock before us already applied and committed these operations
+                return 0
+            applied = all([self._replay(i) for i in entries])
+            # Operations queued by other writers or rejected on replay are coalesced into a single full regeneration
+            changed = refresh() if applied and ids == {i["id"] for i in entries} else self._refresh_all()
+            self._files.journal.commit([i["id"] for i in entries])
+        return changed
+
+    def _flush(self, touched: bool) -> int:
+        self._files.flush()
+        if not self._products.exists():
+            # The first write builds the whole catalog once, every later one only updates its own product
+            UpdateController.build_product_catalog(self._files.source_root, self._files.config)
+        return int(self._products.update(self._product, self._files.product_summary(), touched))
+
+    def recover(self) -> int:
+        if not self._files.lock.acquire(blocking=False):
+            # The writer holding the lock replays the pending operations itself
+            return 0
+        try:
+            return self._run_journaled([], self._refresh_all)
+        finally:
+            self._files.lock.release()
+
+    def _flushed(self, refresh: Callable[[], int]) -> Callable[[], int]:
+        def _refresh() -> int:
+            changed = refresh()
+            changed += self._flush(changed > 0)
+            return changed
+
+        return _refresh
+
+    def refresh_index(self) -> int:
+        return self._run_journaled([], self._flushed(self._refresh_index))
 
     def get_latest_version(self) -> Optional[VersionInfo]:
-        version_codes = self._files.list_version_codes()
-        if len(version_codes) > 0:
-            return self._files.read_version_code_version_info(version_codes[0])
+        latest_version_code = self._files.get_latest_version_code()
+        if latest_version_code is not None:
+            return self._files.read_version_code_version_info(latest_version_code)
         return None
 
-    def refresh_latest(self):
+    def _save_latest(self, latest_version_info: VersionInfo) -> int:
+        return self._files.save_latest_version_info(latest_version_info) + self._files.save_latest_download_info(latest_version_info)
+
+    def _refresh_latest(self, rescan_compats: bool = False) -> int:
         latest_version_info = self.get_latest_version()
         if latest_version_info is not None:
-            self._files.save_latest_version_info(latest_version_info)
-            self._files.save_latest_download_info(latest_version_info)
+            changed = self._save_latest(latest_version_info)
         else:
-            self._files.delete_latest_files()
+            changed = self._files.delete_latest_files()
+        # Compat/ only exists while constrained versions do, so other products skip reading every version's constraints
+        if rescan_compats or self._files.has_compat_latest_files():
+            changed += self._refresh_compat_latest()
+        return changed
+
+    def _refresh_compat_latest(self) -> int:
+        compats = self._files.list_version_compats()
+        if not any(compat.is_constrained() for _, compat in compats):
+            return self._files.delete_compat_latest_files()
+        channels = [DEFAULT_CHANNEL] + sorted({i.channel for _, i in compats if i.channel is not None and i.channel != DEFAULT_CHANNEL})
+        abis = sorted(set(KNOWN_ABIS).union(*[i.abis for _, i in compats]))
+        # Devices use the highest threshold not above their own sdk, 0 standing for versions without minSdk
+        sdks = [0] + sorted({i.min_sdk for _, i in compats if i.min_sdk is not None and i.min_sdk > 0})
+        pending = {(c, a, s) for c in channels for a in abis for s in sdks}
+        answers: dict[tuple[str, str, int], int] = {}
+        # Single descending sweep: the first compatible version seen for a constraint is its latest one
+        for version_code, compat in compats:
+            matched = {i for i in pending if compat.matches(*i)}
+            answers.update((i, version_code) for i in matched)
+            pending -= matched
+            if len(pending) == 0:
+                break
+        infos = {i: self._files.read_version_code_version_info(i) for i in set(answers.values())}
+        header = {"channels": channels, "abis": abis, "minSdks": sdks}
+        return self._files.save_compat_latest_files({k: infos[v] for k, v in answers.items() if infos[v] is not None}, header)
+
+    def refresh_latest(self) -> int:
+        return self._run_journaled([], self._flushed(self._refresh_latest))
+
+    def _refresh_all(self) -> int:
+        changed = self._refresh_index() + self._refresh_latest(rescan_compats=True)
+        changed += self._flush(changed > 0)
+        return changed
+
+    def refresh_all(self) -> int:
+        return self._run_journaled([], self._refresh_all)
+
+    def export(self, full: bool = False) -> int:
+        return self._run_journaled([], lambda: self._files.export_version_files(full) + self._refresh_all())
+
+    def compact(self, policy: RetentionPolicy, bundle_size: int) -> int:
+        def _compact() -> int:
+            version_codes = self._files.list_version_codes()
+            archived = []
+            for position, version_code in enumerate(version_codes):
+                version_index = self._files.read_version_code_index(version_code)
+                if not policy.keeps(position, version_index, self._files.version_mtime(version_code)):
+                    version_info = self._files.read_version_code_version_info(version_code)
+                    if version_info is not None:
+                        archived.append(version_info)
+            if len(archived) > 0:
+                self._files.archive_versions(archived, bundle_size)
+            self._refresh_all()
+            return len(archived)
+
+        return self._run_journaled([], _compact)
+
+    def reshard(self, layout: VersionLayout) -> int:
+        def _reshard() -> int:
+            moved = self._files.reshard(layout)
+            self._refresh_all()
+            return moved
+
+        return self._run_journaled([], _reshard)
+
+    def migrate(self) -> int:
+        def _migrate() -> int:
+            imported = self._files.import_version_files()
+            self._refresh_all()
+            return imported
+
+        return self._run_journaled([], _migrate)
+
+    def _read_recent_index_list(self) -> Optional[list[VersionIndex]]:
+        try:
+            return self._files.read_recent_version_index_list()
+        except (OSError, ValueError):
+            return None
 
-    def refresh_all(self):
-        self.refresh_index()
-        self.refresh_latest()
+    def _apply_version_saved(self, version_info: VersionInfo) -> int:
+        recent_indexes = self._read_recent_index_list()
+        if recent_indexes is None:
+            return self._refresh_all()
+        changed = self._files.export_version_files()
+        changed += self._files.save_version_index_file()
+        position = self._files.count_newer_version_codes(version_info.version_code)
+        if position < self._recent_index_length:
+            recent_indexes = [i for i in recent_indexes if i.version != version_info.version_code]
+            recent_indexes.insert(min(position, len(recent_indexes)), version_info.to_index())
+            changed += self._files.save_recent_index_list(recent_indexes[: self._recent_index_length])
+        if position == 0:
+            changed += self._save_latest(version_info)
+        if version_info.compat.is_constrained() or self._files.has_compat_latest_files():
+            changed += self._refresh_compat_latest()
+        changed += self._refresh_update_answers()
+        changed += self._flush(changed > 0)
+        return changed
+
+    def _apply_version_deleted(self, version_code: int) -> int:
+        recent_indexes = self._read_recent_index_list()
+        if recent_indexes is None:
+            return self._refresh_all()
+        changed = self._files.export_version_files()
+        changed += self._files.save_version_index_file()
+        position = self._files.count_newer_version_codes(version_code)
+        if position < self._recent_index_length:
+            recent_indexes = [i for i in recent_indexes if i.version != version_code]
+            for i in self._files.get_recent_version_codes(self._recent_index_length)[len(recent_indexes) :]:
+                version_index = self._files.read_version_code_index(i)
+                if version_index is not None:
+                    recent_indexes.append(version_index)
+            changed += self._files.save_recent_index_list(recent_indexes)
+        if position == 0:
+            changed += self._refresh_latest()
+        elif self._files.has_compat_latest_files():
+            changed += self._refresh_compat_latest()
+        changed += self._refresh_update_answers()
+        changed += self._flush(changed > 0)
+        return changed
 
     def get_versions(self) -> list[int]:
         return self._files.list_version_codes(descending=False)
@@ -97,9 +331,51 @@ class UpdateController:
     def get_products(source_root: str) -> list[str]:
         return UpdateFileManager.get_products(source_root)
 
+    @staticmethod
+    def build_product_catalog(source_root: str, config: Optional[OutputConfig] = None) -> ProductCatalog:
+        summaries = {}
+        for product in UpdateFileManager.get_products(source_root):
+            try:
+                files = UpdateFileManager(source_root, product, config)
+            except FileNotFoundError:
+                continue
+            summaries[product] = (files.product_summary(), files.product_mtime())
+        catalog = ProductCatalog(source_root, config.sync_headers if config is not None else None)
+        catalog.rebuild(summaries)
+        return catalog
+
+    @staticmethod
+    def get_product_summaries(source_root: str, config: Optional[OutputConfig] = None) -> list[dict]:
+        catalog = ProductCatalog(source_root)
+        if not catalog.exists():
+            catalog = UpdateController.build_product_catalog(source_root, config)
+        return catalog.summaries()
+
+    @staticmethod
+    def refresh_products(source_root: str, recent_index_length: int, config: Optional[OutputConfig] = None, jobs: Optional[int] = None) -> bool:
+        products = UpdateFileManager.get_products(source_root)
+        catalog = ProductCatalog(source_root, config.sync_headers if config is not None else None)
+        if catalog.exists():
+            # Products removed from the tree leave the catalog, the refreshes below update the remaining ones
+            catalog.retain(products)
+        else:
+            UpdateController.build_product_catalog(source_root, config)
+        failed = 0
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_refresh_product, i, source_root, recent_index_length, config): i for i in products}
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is None:
+                    UpdateViewOutputs.product_refreshed(futures[future])
+                else:
+                    UpdateViewOutputs.product_refresh_failed(futures[future], error)
+                    failed += 1
+        UpdateViewOutputs.products_refresh_summary(len(products) - failed, failed)
+        return failed == 0
+
     def is_adding_old_version(self, new_version_info: VersionInfo) -> bool:
-        latest_version_info = self.get_latest_version()
-        return latest_version_info is not None and new_version_info.version_code < latest_version_info.version_code
+        latest_version_code = self._files.get_latest_version_code()
+        return latest_version_code is not None and new_version_info.version_code < latest_version_code
 
     def add_version(
         self,
@@ -107,11 +383,13 @@ class UpdateController:
         replaceable: bool,
         on_adding_old_version: Optional[Callable[[VersionInfo], bool]] = None,
         on_replace_version: Optional[Callable[[VersionInfo], bool]] = None,
+        refresh: bool = True,
     ) -> bool:
-        if not replaceable and self.is_adding_old_version(version_info):
+        adding_old_version = not replaceable and self.is_adding_old_version(version_info)
+        if adding_old_version:
             if on_adding_old_version is not None and not on_adding_old_version(version_info):
                 return False
-        version_exists = self._files.has_version_code(version_info.version_code)
+        version_exists = self._version_exists(version_info.version_code)
         if not replaceable and version_exists:
             UpdateViewOutputs.same_version_code_exists(version_info.version_code)
             return False
@@ -123,14 +401,72 @@ class UpdateController:
                     return False
                 if on_replace_version is not None and not on_replace_version(old_version_info):
                     return False
-            self._files.save_version_code_version_info(version_info)
-            self.refresh_all()
+            operation = self._save_operation(version_info, not replaceable)
+            if not replaceable:
+                if on_adding_old_version is not None and not adding_old_version:
+                    # Only a confirmed old version may end up below a newer one added meanwhile
+                    operation["requireLatest"] = True
+            operations = [operation]
+            if refresh:
+                self._run_journaled(operations, lambda: self._apply_version_saved(version_info))
+                if not replaceable and not self._is_saved(version_info):
+                    UpdateViewOutputs.version_add_rejected(version_info.version_code)
+                    return False
+            else:
+                # Left pending in the journal until the next refresh applies all queued operations at once
+                self._files.journal.append(operations)
             if replaceable:
                 UpdateViewOutputs.new_version_replaced(version_info.version_code, version_info.version_name)
             else:
                 UpdateViewOutputs.new_version_added(version_info.version_code, version_info.version_name)
             return True
 
+    def _is_saved(self, version_info: VersionInfo) -> bool:
+        # The journal stores the dict form, so the comparison uses the same round trip the replay made
+        return self._files.read_version_code_version_info(version_info.version_code) == VersionInfo.from_dict(version_info.to_dict())
+
+    def add_version_templates(self, template_folder: str, replaceable: bool, jobs: Optional[int] = None) -> bool:
+        names = self._files.get_new_version_templates(template_folder)
+        version_infos = self._files.read_version_templates([os.path.join(template_folder, i) for i in names], jobs)
+        return self._add_version_batch(list(zip(names, version_infos)), replaceable)
+
+    def add_version_apks(self, apk_paths: list[str], replaceable: bool, template: Optional[VersionInfo] = None, jobs: Optional[int] = None) -> bool:
+        version_infos = self._files.read_apk_version_infos(apk_paths, template, jobs)
+        return self._add_version_batch([(os.path.basename(p), i) for p, i in zip(apk_paths, version_infos)], replaceable)
+
+    def _add_version_batch(self, entries: list[tuple[str, Union[VersionInfo, Exception]]], replaceable: bool) -> bool:
+        existing_codes = set(self._files.list_version_codes())
+        accepted: dict[int, tuple[str, VersionInfo]] = {}
+        failed = 0
+        for name, version_info in entries:
+            if isinstance(version_info, Exception):
+                UpdateViewOutputs.invalid_version_template(name, version_info)
+                failed += 1
+                continue
+            if version_info.version_code in accepted:
+                UpdateViewOutputs.duplicate_version_template(name, accepted[version_info.version_code][0], version_info.version_code)
+                failed += 1
+            elif not replaceable and version_info.version_code in existing_codes:
+                UpdateViewOutputs.version_template_prefix(name)
+                UpdateViewOutputs.same_version_code_exists(version_info.version_code)
+                failed += 1
+            else:
+                accepted[version_info.version_code] = (name, version_info)
+        if len(accepted) > 0:
+            self._run_journaled([self._save_operation(i, not replaceable) for _, i in accepted.values()], self._refresh_all)
+        for name, version_info in list(accepted.values()):
+            UpdateViewOutputs.version_template_prefix(name)
+            if not replaceable and not self._is_saved(version_info):
+                UpdateViewOutputs.version_add_rejected(version_info.version_code)
+                del accepted[version_info.version_code]
+                failed += 1
+            elif replaceable and version_info.version_code in existing_codes:
+                UpdateViewOutputs.new_version_replaced(version_info.version_code, version_info.version_name)
+            else:
+                UpdateViewOutputs.new_version_added(version_info.version_code, version_info.version_name)
+        UpdateViewOutputs.version_templates_summary(len(accepted), failed)
+        return failed == 0
+
     def delete_version(self, version_code: int, on_deleteing_version: Optional[Callable[[VersionInfo], bool]] = None) -> bool:
         version_info = self._files.read_version_code_version_info(version_code)
         if version_info is None:
@@ -138,26 +474,43 @@ class UpdateController:
             return False
         if on_deleteing_version is not None and not on_deleteing_version(version_info):
             return False
-        if self._files.delete_version_code_version_info(version_code):
-            self.refresh_all()
-            UpdateViewOutputs.version_deleted(version_info.version_code, version_info.version_name)
-            return True
-        else:
-            UpdateViewOutputs.unknown_version_code(version_code)
-            return False
+        self._run_journaled([{"op": "delete", "code": version_code}], lambda: self._apply_version_deleted(version_code))
+        UpdateViewOutputs.version_deleted(version_info.version_code, version_info.version_name)
+        return True
 
 
 class UpdateCommandController:
-    def __init__(self, source_root: str, recent_index_length: int):
+    def __init__(
+        self,
+        source_root: str,
+        recent_index_length: int,
+        config: Optional[OutputConfig] = None,
+        new_version_folder: Optional[str] = None,
+        daemon_socket: Optional[str] = None,
+    ):
         self._source_root: str = source_root
         self._recent_index_length: int = recent_index_length
+        self._new_version_folder: Optional[str] = new_version_folder
+        self._daemon_socket: Optional[str] = daemon_socket
+        self._base_config: OutputConfig = config if config is not None else OutputConfig()
+        self._config: OutputConfig = self._base_config
+        self._controllers: dict[tuple[str, OutputConfig], UpdateController] = {}
 
     def _controller(self, product: str) -> UpdateController:
+        # Controllers are kept so a resident daemon reuses their catalog and caches between commands
+        controller = self._controllers.get((product, self._config))
+        if controller is not None and os.path.isdir(controller.files.product_root):
+            return controller
         try:
-            return UpdateController(product, self._source_root, self._recent_index_length)
+            controller = UpdateController(product, self._source_root, self._recent_index_length, self._config)
         except FileNotFoundError:
             sys.stderr.write(f"Product '{product}' not exists!\n")
             sys.exit(1)
+        except ValueError as e:
+            sys.stderr.write(f"Product '{product}': {e}!\n")
+            sys.exit(1)
+        self._controllers[(product, self._config)] = controller
+        return controller
 
     def _cmd_create(self, args: argparse.Namespace):
         create_type: str = args.create
@@ -176,16 +529,50 @@ class UpdateCommandController:
             product: str = args.product
             controller = self._controller(product)
             UpdateViewOutputs.show_versions(controller.get_versions())
+            archive_ranges = controller.files.list_archive_ranges()
+            if len(archive_ranges) > 0:
+                UpdateViewOutputs.show_archive_ranges(archive_ranges)
         elif show_type == "products":
-            products = UpdateController.get_products(self._source_root)
-            UpdateViewOutputs.show_products(products)
+            UpdateViewOutputs.show_products(UpdateController.get_product_summaries(self._source_root, self._config))
 
     def _cmd_add(self, args: argparse.Namespace, replaceable: bool):
-
         product: str = args.product
-        version_info_path: str = args.version_info
         controller = self._controller(product)
-        version_info = controller.files.read_version_info(version_info_path)
+        if args.batch is not None:
+            if not controller.add_version_templates(args.batch, replaceable, args.jobs):
+                sys.exit(1)
+            return
+        template: Optional[VersionInfo] = None
+        if args.template is not None:
+            try:
+                template = controller.files.read_version_info(args.template)
+            except ValueError as e:
+                sys.stderr.write(f"Invalid version info '{args.template}': {e}\n")
+                sys.exit(1)
+        if args.apk_dir is not None:
+            apks = [os.path.join(args.apk_dir, i) for i in controller.files.list_apks(args.apk_dir)]
+            if len(apks) == 0:
+                UpdateViewOutputs.no_version_templates(args.apk_dir)
+                sys.exit(1)
+            if not controller.add_version_apks(apks, replaceable, template, args.jobs):
+                sys.exit(1)
+            return
+        if args.apks is not None:
+            if len(args.apks) > 1:
+                if not controller.add_version_apks(args.apks, replaceable, template, args.jobs):
+                    sys.exit(1)
+                return
+            version_info = controller.files.read_apk_version_infos(args.apks, template)[0]
+            if isinstance(version_info, Exception):
+                sys.stderr.write(f"Invalid apk '{args.apks[0]}': {version_info}\n")
+                sys.exit(1)
+        else:
+            version_info_path: str = args.version_info
+            try:
+                version_info = controller.files.read_version_template(version_info_path, args.artifact)
+            except (OSError, ValueError) as e:
+                sys.stderr.write(f"Invalid version info '{version_info_path}': {e}\n")
+                sys.exit(1)
         if not controller.add_version(version_info, replaceable):
             sys.exit(1)
 
@@ -198,24 +585,147 @@ class UpdateCommandController:
 
     def _cmd_refresh(self, args: argparse.Namespace):
         refresh_type: str = args.refresh
+        if refresh_type == "all" and args.all_products:
+            if not UpdateController.refresh_products(self._source_root, self._recent_index_length, self._config, args.jobs):
+                sys.exit(1)
+            return
         product: str = args.product
         controller = self._controller(product)
         if refresh_type == "all":
-            controller.refresh_all()
+            changed = controller.refresh_all()
             UpdateViewOutputs.all_refreshed()
         elif refresh_type == "index":
-            controller.refresh_index()
+            changed = controller.refresh_index()
             UpdateViewOutputs.index_refreshed()
-        elif refresh_type == "latest":
-            controller.refresh_latest()
+        else:
+            changed = controller.refresh_latest()
             UpdateViewOutputs.latest_refreshed()
+        UpdateViewOutputs.files_changed(changed)
+
+    def _selected_products(self, args: argparse.Namespace) -> list[str]:
+        return UpdateController.get_products(self._source_root) if args.all_products else [args.product]
+
+    def _cmd_export(self, args: argparse.Namespace):
+        for product in self._selected_products(args):
+            changed = self._controller(product).export(args.full)
+            UpdateViewOutputs.product_exported(product)
+            UpdateViewOutputs.files_changed(changed)
+
+    def _cmd_migrate(self, args: argparse.Namespace):
+        # The recorded backend is switched by the migration itself
+        self._config = dataclasses.replace(self._config, storage=None)
+        for product in self._selected_products(args):
+            try:
+                imported = self._controller(product).migrate()
+            except ValueError as e:
+                UpdateViewOutputs.product_migrate_failed(product, e)
+                sys.exit(1)
+            UpdateViewOutputs.product_migrated(product, imported)
+
+    def _cmd_compact(self, args: argparse.Namespace):
+        keep_since = datetime.datetime.combine(args.keep_since, datetime.time()).timestamp() if args.keep_since is not None else None
+        policy = RetentionPolicy(keep_last=args.keep_last, keep_forced=args.keep_forced, keep_since=keep_since)
+        for product in self._selected_products(args):
+            archived = self._controller(product).compact(policy, args.bundle_size)
+            UpdateViewOutputs.product_compacted(product, archived)
+
+    def _cmd_reshard(self, args: argparse.Namespace):
+        layout = VersionLayout() if args.flat else VersionLayout(shard_size=args.shard_size, flat_links=args.flat_links)
+        for product in self._selected_products(args):
+            moved = self._controller(product).reshard(layout)
+            UpdateViewOutputs.product_resharded(product, moved)
+
+    def _cmd_watch(self, args: argparse.Namespace):
+        products: list[str] = list(dict.fromkeys(args.products))
+        template_folder: Optional[str] = args.templates if args.templates is not None else self._new_version_folder
+        if template_folder is None:
+            sys.stderr.write("Template folder is required!\n")
+            sys.exit(1)
+        controllers = {i: self._controller(i) for i in products}
+        if len(products) == 1:
+            template_folders = {products[0]: template_folder}
+        else:
+            template_folders = {i: os.path.join(template_folder, i) for i in products}
+        watcher = UpdateWatchController(controllers, template_folders, args.debounce, args.interval, args.polling)
+        watcher.run(args.ingest_existing)
+
+    def _cmd_serve(self, args: argparse.Namespace):
+        products: Optional[list[str]] = list(dict.fromkeys(args.products)) if args.products is not None else None
+        server = UpdateServer((args.host, args.port), UpdateSnapshot(self._source_root, products), args.interval, args.verbose)
+        UpdateViewOutputs.serve_started(args.host, server.server_address[1])
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _cmd_daemon(self, args: argparse.Namespace):
+        socket_path: Optional[str] = args.socket if args.socket is not None else self._daemon_socket
+        if socket_path is None:
+            sys.stderr.write("Daemon socket is required!\n")
+            sys.exit(1)
+        try:
+            daemon = UpdateDaemon(socket_path, self.execute_commands)
+        except FileExistsError:
+            sys.stderr.write(f"Daemon is already running on '{socket_path}'!\n")
+            sys.exit(1)
+        # CI stops the daemon with SIGTERM, which must still remove the socket
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        UpdateViewOutputs.daemon_started(socket_path)
+        try:
+            daemon.serve_forever()
+        finally:
+            daemon.server_close()
 
     def _cmd_about(self, _: argparse.Namespace):
         UpdateViewOutputs.show_about()
 
+    def _apply_output_options(self, args: argparse.Namespace):
+        changes = {}
+        if args.precompress is not None:
+            changes["precompress"] = args.precompress
+        if args.gzip_level is not None:
+            changes["gzip_level"] = args.gzip_level
+        if args.brotli_quality is not None:
+            changes["brotli_quality"] = args.brotli_quality
+        if args.sync_headers is not None:
+            changes["sync_headers"] = args.sync_headers
+        if args.update_answers is not None:
+            changes["update_answers"] = args.update_answers
+        if args.index_page_size is not None:
+            changes["version_index_page_size"] = args.index_page_size
+        if args.storage is not None:
+            changes["storage"] = args.storage
+        if args.slim_versions is not None:
+            changes["slim_versions"] = args.slim_versions
+        self._config = dataclasses.replace(self._base_config, **changes)
+
     def execute_commands(self, argv: list[str]):
         args = parse_args(argv)
-        commands = ["create", "show", "add", "replace", "delete", "refresh", "about"]
+        self._apply_output_options(args)
+        if not args.profile and args.profile_output is None and args.trace is None and args.cprofile is None:
+            self._dispatch(args)
+            return
+        profiler = IOProfiler(trace=args.trace is not None)
+        profiler.install([UpdateFileManager, UpdateController])
+        c_profile = cProfile.Profile() if args.cprofile is not None else None
+        try:
+            if c_profile is not None:
+                c_profile.runcall(self._dispatch, args)
+            else:
+                self._dispatch(args)
+        finally:
+            profiler.uninstall()
+            if args.profile:
+                UpdateViewOutputs.profile_summary(profiler.summary())
+            if args.profile_output is not None:
+                profiler.dump_summary(args.profile_output)
+            if args.trace is not None:
+                profiler.dump_trace(args.trace)
+            if c_profile is not None:
+                c_profile.dump_stats(args.cprofile)
+
+    def _dispatch(self, args: argparse.Namespace):
+        commands = ["create", "show", "add", "replace", "delete", "refresh", "export", "migrate", "reshard", "compact", "watch", "serve", "daemon", "about"]
         func = [
             self._cmd_create,
             self._cmd_show,
@@ -223,15 +733,85 @@ class UpdateCommandController:
             lambda a: self._cmd_add(a, True),
             self._cmd_delete,
             self._cmd_refresh,
+            self._cmd_export,
+            self._cmd_migrate,
+            self._cmd_reshard,
+            self._cmd_compact,
+            self._cmd_watch,
+            self._cmd_serve,
+            self._cmd_daemon,
             self._cmd_about,
         ]
         func[commands.index(args.command)](args)
 
 
+class UpdateWatchController:
+    def __init__(self, controllers: dict[str, UpdateController], template_folders: dict[str, str], debounce: float, interval: float, polling: bool):
+        self._controllers: dict[str, UpdateController] = controllers
+        self._template_folders: dict[str, str] = template_folders
+        self._debounce: float = debounce
+        self._template_states: dict[str, dict[str, tuple[int, int]]] = {}
+        for folder in template_folders.values():
+            os.makedirs(folder, exist_ok=True)
+        for controller in controllers.values():
+            os.makedirs(controller.files.versions_dir, exist_ok=True)
+        self._folder_products: dict[str, str] = {v: k for k, v in template_folders.items()}
+        self._folder_products.update({v.files.versions_dir: k for k, v in controllers.items()})
+        self._watcher = create_folder_watcher(
+            list(template_folders.values()), [i.files.versions_dir for i in controllers.values()], interval, polling
+        )
+
+    def _scan_templates(self, product: str) -> dict[str, tuple[int, int]]:
+        folder = self._template_folders[product]
+        states = {}
+        for name in UpdateFileManager.get_new_version_templates(folder):
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except FileNotFoundError:
+                continue
+            states[name] = (stat.st_mtime_ns, stat.st_size)
+        return states
+
+    def _process(self, product: str):
+        controller = self._controllers[product]
+        states = self._scan_templates(product)
+        old_states = self._template_states.get(product, {})
+        names = sorted(i for i in states if states[i] != old_states.get(i))
+        version_infos = controller.files.read_version_templates([os.path.join(self._template_folders[product], i) for i in names])
+        for name, version_info in zip(names, version_infos):
+            if isinstance(version_info, Exception):
+                UpdateViewOutputs.invalid_version_template(name, version_info)
+                continue
+            UpdateViewOutputs.version_template_prefix(name)
+            controller.add_version(version_info, controller.files.has_version_code(version_info.version_code), refresh=False)
+        self._template_states[product] = states
+        changed = controller.refresh_all()
+        UpdateViewOutputs.product_refreshed(product)
+        UpdateViewOutputs.files_changed(changed)
+
+    def run(self, ingest_existing: bool = False):
+        for product in self._controllers:
+            if not ingest_existing:
+                self._template_states[product] = self._scan_templates(product)
+        pending: set[str] = set(self._controllers) if ingest_existing else set()
+        last_event_time = 0.0
+        UpdateViewOutputs.watch_started(self._watcher.name, list(self._folder_products))
+        while True:
+            changed_folders = self._watcher.wait(self._debounce)
+            if len(changed_folders) > 0:
+                pending.update(self._folder_products[i] for i in changed_folders if i in self._folder_products)
+                last_event_time = time.monotonic()
+            elif len(pending) > 0 and time.monotonic() - last_event_time >= self._debounce:
+                for product in sorted(pending):
+                    self._process(product)
+                pending.clear()
+                self._watcher.reset()
+
+
 class UpdateInteractiveController:
-    def __init__(self, product: str, source_root: str, recent_index_length: int, new_version_folder: str):
+    def __init__(self, product: str, source_root: str, recent_index_length: int, new_version_folder: str, config: Optional[OutputConfig] = None):
         self._new_version_folder: str = new_version_folder
-        self._controller = UpdateController(product, source_root, recent_index_length)
+        self._controller = UpdateController(product, source_root, recent_index_length, config)
 
     @staticmethod
     def get_product(source_root: str) -> Optional[str]:
@@ -254,7 +834,11 @@ class UpdateInteractiveController:
             return None
         else:
             file_path = os.path.join(self._new_version_folder, file_name)
-            return self._controller.files.read_version_info(file_path)
+            try:
+                return self._controller.files.read_version_template(file_path)
+            except (OSError, ValueError) as e:
+                UpdateViewOutputs.invalid_version_template(file_name, e)
+                return None
 
     def _on_list_versions(self):
         UpdateViewOutputs.show_versions(self._controller.get_versions())
@@ -277,6 +861,13 @@ class UpdateInteractiveController:
             ),
         )
 
+    def _on_add_all_versions(self, replaceable: bool):
+        new_versions = self._controller.files.get_new_version_templates(self._new_version_folder)
+        if len(new_versions) == 0:
+            UpdateViewOutputs.no_version_templates(self._new_version_folder)
+        elif UpdateViewInputs.validate_add_version_templates(len(new_versions), self._new_version_folder, replaceable):
+            self._controller.add_version_templates(self._new_version_folder, replaceable)
+
     def _on_delete_version(self):
         version_code = UpdateViewInputs.get_delete_version_code(self._controller.get_choose_version_code_validator())
         if version_code is None:
@@ -290,8 +881,9 @@ class UpdateInteractiveController:
         )
 
     def _on_refresh_all(self):
-        self._controller.refresh_all()
+        changed = self._controller.refresh_all()
         UpdateViewOutputs.all_refreshed()
+        UpdateViewOutputs.files_changed(changed)
 
     @staticmethod
     def show_banner():
@@ -304,6 +896,7 @@ class UpdateInteractiveController:
             on_list_versions=self._on_list_versions,
             on_add_version=lambda: self._on_add_version(False),
             on_replace_version=lambda: self._on_add_version(True),
+            on_add_all_versions=lambda: self._on_add_all_versions(False),
             on_delete_version=self._on_delete_version,
             on_refresh_all=self._on_refresh_all,
         )
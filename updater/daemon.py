@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+import json
+import socket
+import traceback
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+from typing import Callable
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    server: "UpdateDaemon"
+
+    def handle(self):
+        request = json.loads(self.rfile.read())
+        code, stdout, stderr = self.server.execute(request["argv"], request["cwd"])
+        self.wfile.write(json.dumps({"code": code, "stdout": stdout, "stderr": stderr}).encode("utf-8"))
+
+
+class UpdateDaemon(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str, execute_commands: Callable[[list[str]], None]):
+        self._socket_path: str = socket_path
+        self._execute_commands: Callable[[list[str]], None] = execute_commands
+        if os.path.exists(socket_path):
+            if is_daemon_running(socket_path):
+                raise FileExistsError(socket_path)
+            os.remove(socket_path)
+        super().__init__(socket_path, _DaemonRequestHandler)
+
+    def execute(self, argv: list[str], cwd: str) -> tuple[int, str, str]:
+        stdout, stderr = io.StringIO(), io.StringIO()
+        old_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    self._execute_commands(argv)
+                    code = 0
+                except SystemExit as e:
+                    if e.code is None or isinstance(e.code, int):
+                        code = e.code or 0
+                    else:
+                        print(e.code, file=sys.stderr)
+                        code = 1
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+        finally:
+            os.chdir(old_cwd)
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+
+
+def is_daemon_running(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+            return True
+    except OSError:
+        return False
@@ -1,46 +1,113 @@
 import os
-import json
-from typing import Union, Optional
-
-from .model import VersionInfo, VersionIndex
-
-
-def _list_jsons(folder_path: str) -> list[str]:
-    return sorted(
-        [i for i in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, i)) and i.endswith(".json") and not i.startswith(".")]
-    )
-
-
-def _load_json(path: str) -> Union[dict, list]:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def _dump_json(path: str, content: Union[dict, list]):
-    with open(path, "w", encoding="utf-8") as f:
-        return json.dump(content, f)
-
-
-def _prepare_parent_dir(path: str):
-    parent_dir = os.path.dirname(path)
-    if not parent_dir.isspace() or len(parent_dir) == 0:
-        if not os.path.exists(parent_dir):
-            os.makedirs(parent_dir)
+import gzip
+import dataclasses
+import shutil
+from typing import Optional, Union
+
+from .apk import read_apk_manifests, apk_version_info
+from .archive import ArchivePlan, VersionArchive
+from .cache import FileStatCache
+from .catalog import VersionCatalog, ShardedVersionCatalog
+from .checksum import compute_checksums
+from .changelog import change_log_blob, change_log_hash
+from .config import OutputConfig
+from .journal import OperationJournal, ProductLock
+from .layout import VersionLayout, SHARDS_DIR, is_version_path
+from .manifest import ProductManifest
+from .model import ModelDecodeError, VersionInfo, VersionIndex, VersionCompat
+from .options import ProductOptions
+from .products import empty_product_summary
+from .storage import VersionStore, FileVersionStore, SqliteVersionStore
+from .utils import list_jsons, load_json, read_bytes, dump_json, serialize_json, write_bytes, link_file, remove_file, prepare_parent_dir
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 class UpdateFileManager:
     _VERSIONS_DIR = "Version"
     _VERSIONS_INDEX_FILE = "Index"
+    _VERSIONS_INDEX_HEADER_FILE = "Header"
+    _ARCHIVE_DIR = "Archive"
+    _ARCHIVE_INDEX_FILE = "Index"
     _RECENT_INDEX_FILE = "Index"
     _LATEST_FILE = "Latest"
     _LATEST_DOWNLOAD_FILE = "LatestDownload"
-
-    def __init__(self, source_root: str, product: str):
+    _UPDATE_ANSWERS_DIR = "Since"
+    _CHANGE_LOGS_DIR = "Changelog"
+    _COMPAT_DIR = "Compat"
+    _COMPAT_HEADER_FILE = "Header"
+    _CACHE_DIR = ".cache"
+    _SYNC_DIR = ".sync"
+    _VERSION_META_CACHE_FILE = "version_meta.json"
+    _APK_MANIFEST_CACHE_FILE = "apk_manifests.json"
+    _CHECKSUM_CACHE_FILE = "checksums.json"
+    _APK_SUFFIX = ".apk"
+    _DATABASE_FILE = ".updates.db"
+    _JOURNAL_FILE = "journal"
+    _LOCK_FILE = "lock"
+    _LAYOUT_FILE = "layout.json"
+    _OPTIONS_FILE = "options.json"
+    _DEFAULT_ARCHIVE_BUNDLE_SIZE = 500
+    _GZIP_SUFFIX = ".gz"
+    _BROTLI_SUFFIX = ".br"
+
+    def __init__(self, source_root: str, product: str, config: Optional[OutputConfig] = None):
         self._source_root: str = source_root
         self._product: str = product
+        self._requested_config: OutputConfig = config if config is not None else OutputConfig()
         self._product_root: str = os.path.join(source_root, product)
         if not os.path.exists(self._product_root):
             raise FileNotFoundError(self._product_root)
+        self._saved_options: ProductOptions = ProductOptions.load(self.options_file)
+        self._options: ProductOptions = self._resolve_options(self._saved_options)
+        self._config: OutputConfig = self._options.apply(self._requested_config)
+        self._exported_slim_versions: Optional[bool] = self._saved_options.slim_versions
+        self._manifest: ProductManifest = ProductManifest(self._product_root, os.path.join(self._product_root, self._SYNC_DIR))
+        self._layout: VersionLayout = VersionLayout.load(self.layout_file)
+        self._store: VersionStore = self._open_store()
+        self._archive: VersionArchive = VersionArchive(self.archive_dir, os.path.join(self.archive_dir, self._ARCHIVE_INDEX_FILE))
+        self._journal: OperationJournal = OperationJournal(os.path.join(self._product_root, self._SYNC_DIR, self._JOURNAL_FILE))
+        self._lock: ProductLock = ProductLock(os.path.join(self._product_root, self._SYNC_DIR, self._LOCK_FILE))
+        self._apk_cache: FileStatCache = FileStatCache(os.path.join(self._product_root, self._CACHE_DIR, self._APK_MANIFEST_CACHE_FILE))
+        self._checksum_cache: FileStatCache = FileStatCache(os.path.join(self._product_root, self._CACHE_DIR, self._CHECKSUM_CACHE_FILE))
+
+    def _resolve_options(self, saved_options: ProductOptions) -> ProductOptions:
+        options = saved_options.resolve(self._requested_config)
+        if options.storage is None:
+            # Products migrated before the backend was recorded only left their rows in the database
+            storage = "sqlite" if SqliteVersionStore.has_product(self.database_file(self._source_root), self._product) else "files"
+            options = dataclasses.replace(options, storage=storage)
+        if options.slim_versions is None:
+            # Likewise products that wrote slim versions before the setting was recorded only left their blobs
+            options = dataclasses.replace(options, slim_versions=os.path.isdir(self.change_logs_dir))
+        return options
+
+    def _use_storage(self, storage: str):
+        self._options = dataclasses.replace(self._options, storage=storage)
+        self._config = self._options.apply(self._requested_config)
+        self._store = self._open_store()
+
+    def _open_store(self) -> VersionStore:
+        if self._config.storage == "sqlite":
+            return SqliteVersionStore(self.database_file(self._source_root), self._product)
+        meta_cache_path = os.path.join(self._product_root, self._CACHE_DIR, self._VERSION_META_CACHE_FILE)
+        return FileVersionStore(self._open_catalog(), self.version_file, meta_cache_path, self.read_change_log, lambda: self._config.slim_versions)
+
+    def _open_catalog(self) -> Union[VersionCatalog, ShardedVersionCatalog]:
+        if self._layout.sharded:
+            return ShardedVersionCatalog(self.shards_dir, self._layout.shard_size)
+        return VersionCatalog(self.versions_dir)
+
+    @staticmethod
+    def database_file(source_root: str) -> str:
+        return os.path.join(source_root, UpdateFileManager._DATABASE_FILE)
+
+    @property
+    def config(self) -> OutputConfig:
+        return self._config
 
     @property
     def source_root(self) -> str:
@@ -62,8 +129,31 @@ class UpdateFileManager:
     def versions_index_file(self) -> str:
         return os.path.join(self.versions_dir, self._VERSIONS_INDEX_FILE)
 
+    @property
+    def archive_dir(self) -> str:
+        return os.path.join(self.versions_dir, self._ARCHIVE_DIR)
+
+    @property
+    def shards_dir(self) -> str:
+        return os.path.join(self.versions_dir, SHARDS_DIR)
+
+    @property
+    def layout_file(self) -> str:
+        return os.path.join(self._product_root, self._SYNC_DIR, self._LAYOUT_FILE)
+
+    @property
+    def layout(self) -> VersionLayout:
+        return self._layout
+
+    @property
+    def options_file(self) -> str:
+        return os.path.join(self._product_root, self._SYNC_DIR, self._OPTIONS_FILE)
+
     def version_file(self, version_code: int) -> str:
-        return os.path.join(self.versions_dir, str(version_code))
+        return os.path.join(self._product_root, *self._layout.relative_path(version_code).split("/"))
+
+    def _version_files(self, version_code: int) -> list[str]:
+        return [os.path.join(self._product_root, *i.split("/")) for i in self._layout.relative_paths(version_code)]
 
     @property
     def recent_index_file(self) -> str:
@@ -77,9 +167,162 @@ class UpdateFileManager:
     def latest_download_file(self) -> str:
         return os.path.join(self._product_root, self._LATEST_DOWNLOAD_FILE)
 
+    @property
+    def update_answers_dir(self) -> str:
+        return os.path.join(self._product_root, self._UPDATE_ANSWERS_DIR)
+
+    @property
+    def compat_dir(self) -> str:
+        return os.path.join(self._product_root, self._COMPAT_DIR)
+
+    @property
+    def change_logs_dir(self) -> str:
+        return os.path.join(self._product_root, self._CHANGE_LOGS_DIR)
+
+    def change_log_file(self, hash_value: str) -> str:
+        return os.path.join(self.change_logs_dir, hash_value)
+
+    @property
+    def journal(self) -> OperationJournal:
+        return self._journal
+
+    @property
+    def lock(self) -> ProductLock:
+        return self._lock
+
+    @property
+    def manifest_file(self) -> str:
+        return self._manifest.manifest_file
+
+    def manifest_entry(self, path: str) -> Optional[dict]:
+        return self._manifest.get(path)
+
+    def list_served_files(self) -> list[str]:
+        served_files = []
+        for root, dirs, names in os.walk(self._product_root):
+            dirs[:] = [i for i in dirs if not i.startswith(".")]
+            served_files.extend(os.path.join(root, i) for i in names if not i.startswith(".") and not i.endswith((self._GZIP_SUFFIX, self._BROTLI_SUFFIX)))
+        return served_files
+
+    def _sidecar_files(self, path: str) -> list[str]:
+        return [path + self._GZIP_SUFFIX] + ([path + self._BROTLI_SUFFIX] if brotli is not None else [])
+
+    def _track_file(self, path: str, data: Optional[bytes], changed: bool):
+        if changed or self._manifest.get(path) is None:
+            if data is None:
+                data = read_bytes(path)
+            self._manifest.record(path, data)
+
+    def _save_sidecars(self, path: str, data: bytes, changed: bool) -> int:
+        written = 0
+        sidecars = [(path + self._GZIP_SUFFIX, lambda: gzip.compress(data, compresslevel=self._config.gzip_level, mtime=0))]
+        if brotli is not None:
+            sidecars.append((path + self._BROTLI_SUFFIX, lambda: brotli.compress(data, quality=self._config.brotli_quality)))
+        for sidecar_path, compress in sidecars:
+            if changed or not os.path.exists(sidecar_path):
+                sidecar_data = compress()
+                sidecar_changed = write_bytes(sidecar_path, sidecar_data)
+                self._track_file(sidecar_path, sidecar_data, sidecar_changed)
+                written += sidecar_changed
+            else:
+                self._track_file(sidecar_path, None, False)
+        return written
+
+    def _save_json(self, path: str, content: Union[dict, list]) -> int:
+        return self._save_bytes(path, serialize_json(content))
+
+    def _save_bytes(self, path: str, data: bytes) -> int:
+        stamp = self._store.stamp(path)
+        prepare_parent_dir(path)
+        changed = write_bytes(path, data)
+        self._track_file(path, data, changed)
+        written = int(changed)
+        if self._config.precompress:
+            written += self._save_sidecars(path, data, changed)
+        elif changed:
+            self._delete_sidecars(path)
+        self._store.sync(stamp)
+        return written
+
+    def sync_version_files(self, version_codes: list[int]) -> int:
+        written = 0
+        live_files = set()
+        for i in version_codes:
+            for relative_path in self._layout.relative_paths(i):
+                live_files.update([relative_path, relative_path + self._GZIP_SUFFIX, relative_path + self._BROTLI_SUFFIX])
+        for relative_path in list(self._manifest.entries):
+            if is_version_path(relative_path) and relative_path not in live_files:
+                self._manifest.remove(os.path.join(self._product_root, relative_path))
+        for version_code in version_codes:
+            version_file = self.version_file(version_code)
+            try:
+                mtime_ns = os.stat(version_file).st_mtime_ns
+            except FileNotFoundError:
+                # Stored versions whose files were removed by hand come back with a full export
+                continue
+            entry = self._manifest.get(version_file)
+            changed = entry is None or entry["mtime"] != mtime_ns
+            if changed or (self._config.precompress and not all(os.path.exists(i) for i in self._sidecar_files(version_file))):
+                data = read_bytes(version_file)
+                self._track_file(version_file, data, changed)
+                if self._config.precompress:
+                    stamp = self._store.stamp(version_file)
+                    written += self._save_sidecars(version_file, data, changed)
+                    self._store.sync(stamp)
+            if self._layout.flat_links and (changed or self._manifest.get(os.path.join(self.versions_dir, str(version_code))) is None):
+                written += self._link_flat_version_file(version_code)
+        return written
+
+    def _delete_sidecars(self, path: str):
+        for i in [path + self._GZIP_SUFFIX, path + self._BROTLI_SUFFIX]:
+            self._manifest.remove(i)
+            remove_file(i)
+
+    def _delete_file(self, path: str) -> bool:
+        stamp = self._store.stamp(path)
+        self._delete_sidecars(path)
+        self._manifest.remove(path)
+        deleted = remove_file(path)
+        self._store.sync(stamp)
+        return deleted
+
+    def _link_flat_version_file(self, version_code: int) -> int:
+        version_file = self.version_file(version_code)
+        flat_file = os.path.join(self.versions_dir, str(version_code))
+        written = 0
+        for source_path, target_path in [(version_file, flat_file)] + list(zip(self._sidecar_files(version_file), self._sidecar_files(flat_file))):
+            if os.path.exists(source_path):
+                linked = link_file(source_path, target_path)
+                self._track_file(target_path, None, linked)
+                written += linked
+            else:
+                self._manifest.remove(target_path)
+                written += remove_file(target_path)
+        return written
+
+    def _save_version_file(self, info: VersionInfo) -> int:
+        changed = self._save_json(self.version_file(info.version_code), self._version_content(info))
+        if self._layout.flat_links:
+            changed += self._link_flat_version_file(info.version_code)
+        return changed
+
+    def _delete_version_files(self, version_code: int) -> bool:
+        return any([self._delete_file(i) for i in self._version_files(version_code)])
+
+    def _list_version_files(self) -> list[tuple[int, str]]:
+        # Every layout is scanned, so files left behind by an earlier layout are found as well
+        folders = [self.versions_dir]
+        if os.path.isdir(self.shards_dir):
+            folders.extend(os.path.join(self.shards_dir, i) for i in sorted(os.listdir(self.shards_dir)) if i.isdigit())
+        files = []
+        for folder in folders:
+            if os.path.isdir(folder):
+                files.extend((int(i), os.path.join(folder, i)) for i in os.listdir(folder) if i.isdigit())
+        return files
+
     @staticmethod
     def read_version_info(path: str) -> VersionInfo:
-        return VersionInfo.from_dict(_load_json(path))
+        return VersionInfo.from_dict(load_json(path))
 
     @staticmethod
     def delete_version_info(path: str):
@@ -87,56 +330,217 @@ class UpdateFileManager:
 
     @staticmethod
     def get_new_version_templates(folder_path: str) -> list[str]:
-        return _list_jsons(folder_path) if os.path.exists(folder_path) else []
+        return list_jsons(folder_path) if os.path.exists(folder_path) else []
+
+    @staticmethod
+    def list_apks(folder_path: str) -> list[str]:
+        return sorted(i for i in os.listdir(folder_path) if i.endswith(UpdateFileManager._APK_SUFFIX) and os.path.isfile(os.path.join(folder_path, i)))
+
+    def read_apk_version_infos(self, paths: list[str], template: Optional[VersionInfo] = None, jobs: Optional[int] = None) -> list[Union[VersionInfo, Exception]]:
+        results: list[Union[VersionInfo, Exception]] = []
+        for path, manifest in zip(paths, read_apk_manifests(paths, self._apk_cache, jobs)):
+            if isinstance(manifest, Exception):
+                results.append(manifest)
+                continue
+            # A json next to the apk carries the fields a manifest has no room for, like change log and download sources
+            sidecar = os.path.splitext(path)[0] + ".json"
+            try:
+                results.append(apk_version_info(manifest, self.read_version_info(sidecar) if os.path.isfile(sidecar) else template))
+            except (OSError, ValueError) as e:
+                results.append(e)
+        return self.attach_checksums(results, paths, jobs)
+
+    def attach_checksums(
+        self, version_infos: list[Union[VersionInfo, Exception]], artifacts: list[Optional[str]], jobs: Optional[int] = None
+    ) -> list[Union[VersionInfo, Exception]]:
+        hashed = [i for i, v in enumerate(version_infos) if artifacts[i] is not None and not isinstance(v, Exception)]
+        results = list(version_infos)
+        for i, checksum in zip(hashed, compute_checksums([artifacts[i] for i in hashed], self._checksum_cache, jobs)):
+            results[i] = checksum if isinstance(checksum, Exception) else results[i].with_checksum(*checksum)
+        return results
+
+    @staticmethod
+    def template_artifact(template_path: str) -> Optional[str]:
+        artifact = os.path.splitext(template_path)[0] + UpdateFileManager._APK_SUFFIX
+        return artifact if os.path.isfile(artifact) else None
+
+    def read_version_templates(self, paths: list[str], jobs: Optional[int] = None) -> list[Union[VersionInfo, Exception]]:
+        version_infos: list[Union[VersionInfo, Exception]] = []
+        for path in paths:
+            try:
+                version_infos.append(self.read_version_info(path))
+            except (OSError, ValueError) as e:
+                version_infos.append(e)
+        # An apk next to a template is the artifact its download sources point at
+        return self.attach_checksums(version_infos, [self.template_artifact(i) for i in paths], jobs)
+
+    def read_version_template(self, path: str, artifact: Optional[str] = None) -> VersionInfo:
+        version_info = self.read_version_info(path)
+        artifact = artifact if artifact is not None else self.template_artifact(path)
+        result = self.attach_checksums([version_info], [artifact])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def read_change_log(self, hash_value: str) -> str:
+        data = load_json(self.change_log_file(hash_value))
+        if not isinstance(data, dict) or not isinstance(data.get("changeLog"), str):
+            raise ModelDecodeError(f"{self._CHANGE_LOGS_DIR}/{hash_value}", "invalid change log blob")
+        return data["changeLog"]
+
+    def _save_change_log(self, change_log: str) -> str:
+        hash_value = change_log_hash(change_log)
+        change_log_file = self.change_log_file(hash_value)
+        # Blobs are content addressed, so an existing one never needs to be rewritten
+        if not os.path.exists(change_log_file) or self._manifest.get(change_log_file) is None:
+            self._save_bytes(change_log_file, change_log_blob(change_log))
+        return hash_value
+
+    def _version_content(self, info: VersionInfo) -> dict:
+        if not self._config.slim_versions:
+            return info.to_dict()
+        hash_value = self._save_change_log(info.change_log)
+        # The same content lands in Latest, Version/ and Compat/ files, so the blob is referenced by its served path, not relative to any of them
+        return info.to_slim_dict(hash_value, f"/{self._product}/{self._CHANGE_LOGS_DIR}/{hash_value}")
+
+    def sync_change_logs(self, version_codes: list[int]) -> int:
+        if not os.path.isdir(self.change_logs_dir):
+            return 0
+        # Version files carry their own change log unless they are slim, and sqlite exports follow the slim setting
+        referenced = {self._store.change_log_hash(i) for i in version_codes} if self._store.materialized or self._config.slim_versions else set()
+        changed = 0
+        for name in os.listdir(self.change_logs_dir):
+            if not name.startswith(".") and not name.endswith((self._GZIP_SUFFIX, self._BROTLI_SUFFIX)) and name not in referenced:
+                changed += self._delete_file(os.path.join(self.change_logs_dir, name))
+        return changed
 
     def read_version_code_version_info(self, version_code: int) -> Optional[VersionInfo]:
-        version_file = self.version_file(version_code)
-        if os.path.exists(version_file):
-            return self.read_version_info(version_file)
-        else:
-            return None
+        info = self._store.get(version_code)
+        return info if info is not None else self._archive.get(version_code)
+
+    def read_version_code_index(self, version_code: int) -> Optional[VersionIndex]:
+        return self._store.get_index(version_code)
 
     def delete_version_code_version_info(self, version_code: int) -> bool:
-        version_file = self.version_file(version_code)
-        if os.path.exists(version_file):
-            self.delete_version_info(version_file)
+        if version_code not in self._store and version_code in self._archive:
+            self._save_archive(self._archive.plan([], {version_code}, set(self._store.versions()), self._archive_bundle_size()))
+            return True
+        if not self._store.materialized:
+            return self._store.remove(version_code)
+        if os.path.exists(self.version_file(version_code)):
+            self._delete_version_files(version_code)
+            self._store.remove(version_code)
             return True
         else:
             return False
 
     def read_recent_version_index_list(self, num: Optional[int] = None, descending: bool = True) -> list[VersionIndex]:
-        indexes = [VersionIndex.from_dict(i) for i in _load_json(self.recent_index_file)]
+        data = load_json(self.recent_index_file)
+        if not isinstance(data, list):
+            raise ModelDecodeError("$", f"expected array, got {type(data).__name__}")
+        indexes = [VersionIndex.from_dict(v, f"$[{i}]") for i, v in enumerate(data)]
         indexes.sort(key=lambda x: x.version, reverse=descending)
         if num is not None:
             indexes = indexes[:num]
         return indexes
 
-    def _get_version_code_list(self) -> list[int]:
-        folder_path = self.versions_dir
-        if not os.path.exists(folder_path):
-            return []
-        else:
-            return [int(i) for i in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, i)) and i.isdigit()]
-
     def list_version_codes(self, descending: bool = True) -> list[int]:
-        versions = self._get_version_code_list()
-        versions.sort(reverse=descending)
-        return versions
+        return self._store.versions(descending)
 
     def has_version_code(self, version_code: int) -> bool:
-        versions = self._get_version_code_list()
-        return version_code in versions
+        return version_code in self._store
 
-    @staticmethod
-    def save_version_info(path: str, info: VersionInfo):
-        _prepare_parent_dir(path)
-        _dump_json(path, info.to_dict())
+    def get_recent_version_codes(self, num: int) -> list[int]:
+        return self._store.top(num)
 
-    def save_version_code_version_info(self, info: VersionInfo):
-        self.save_version_info(self.version_file(info.version_code), info)
+    def count_newer_version_codes(self, version_code: int) -> int:
+        return self._store.newer_count(version_code)
 
-    def save_latest_version_info(self, info: VersionInfo):
-        self.save_version_info(self.latest_file, info)
+    def get_latest_version_code(self) -> Optional[int]:
+        return self._store.latest()
+
+    def rescan_version_codes(self):
+        self._store.invalidate()
+
+    @staticmethod
+    def save_version_info(path: str, info: VersionInfo) -> bool:
+        prepare_parent_dir(path)
+        return dump_json(path, info.to_dict())
+
+    def save_version_code_version_info(self, info: VersionInfo) -> int:
+        if info.version_code in self._archive:
+            # A re-added version is active again and leaves its bundle
+            self._save_archive(self._archive.plan([], {info.version_code}, {info.version_code, *self._store.versions()}, self._archive_bundle_size()))
+        if not self._store.materialized:
+            return self._store.put(info)
+        changed = self._save_version_file(info)
+        self._store.put(info)
+        return changed
+
+    def export_version_files(self, full: bool = False) -> int:
+        if self._store.materialized:
+            # A full export rewrites the records themselves, e.g. after switching to or from slim versions
+            return sum(self.save_version_code_version_info(self._store.get(i)) for i in self._store.versions()) if full else 0
+        if full or self._exported_slim_versions != self._config.slim_versions:
+            # Exported files are rewritten once the slim setting changes, so the blobs they reference follow it too
+            self._store.mark_all_unexported()
+        changed, exported_codes, removed_codes = 0, [], self._store.removed()
+        for info in self._store.unexported():
+            changed += self._save_version_file(info)
+            exported_codes.append(info.version_code)
+        for version_code in removed_codes:
+            changed += self._delete_version_files(version_code)
+        if full:
+            # Files left by older exports or manual edits are not tracked by any row
+            for version_code, path in self._list_version_files():
+                if version_code not in self._store or path not in self._version_files(version_code):
+                    changed += self._delete_file(path)
+        self._store.mark_exported(exported_codes, removed_codes)
+        self._exported_slim_versions = self._config.slim_versions
+        return changed
+
+    def import_version_files(self) -> int:
+        # Every file is decoded before the backend switches, so a malformed one leaves the product on its files
+        version_codes = self._open_catalog().versions(descending=False)
+        infos = [VersionInfo.from_dict(load_json(self.version_file(i)), change_log_loader=self.read_change_log) for i in version_codes]
+        self._use_storage("sqlite")
+        for info in infos:
+            # Existing files are already the export of the rows imported here
+            self._store.put(info, exported=True)
+        return len(infos)
+
+    def reshard(self, layout: VersionLayout) -> int:
+        version_files: dict[int, list[str]] = {}
+        for version_code, path in self._list_version_files():
+            version_files.setdefault(version_code, []).append(path)
+        self._layout = layout
+        moved = 0
+        for version_code, paths in sorted(version_files.items()):
+            version_file = self.version_file(version_code)
+            if version_file not in paths:
+                prepare_parent_dir(version_file)
+                for source_path, target_path in [(paths[0], version_file)] + list(zip(self._sidecar_files(paths[0]), self._sidecar_files(version_file))):
+                    if os.path.exists(source_path):
+                        os.replace(source_path, target_path)
+                moved += 1
+            # Moved paths are gone already, so this only drops them from the manifest
+            for path in [i for i in paths if i not in self._version_files(version_code)]:
+                self._delete_file(path)
+            if layout.flat_links:
+                self._link_flat_version_file(version_code)
+        if os.path.isdir(self.shards_dir):
+            for name in os.listdir(self.shards_dir):
+                if len(os.listdir(os.path.join(self.shards_dir, name))) == 0:
+                    os.rmdir(os.path.join(self.shards_dir, name))
+            if len(os.listdir(self.shards_dir)) == 0:
+                os.rmdir(self.shards_dir)
+        layout.save(self.layout_file)
+        if self._store.materialized:
+            self._store = self._open_store()
+        return moved
+
+    def save_latest_version_info(self, info: VersionInfo) -> int:
+        return self._save_json(self.latest_file, self._version_content(info))
 
     @staticmethod
     def save_template_version_info(name: str, path: str) -> str:
@@ -148,21 +552,183 @@ class UpdateFileManager:
         UpdateFileManager.save_version_info(file_path, VersionInfo.empty_instance())
         return file_path
 
-    def save_latest_download_info(self, info: VersionInfo):
-        _prepare_parent_dir(self.latest_download_file)
-        _dump_json(self.latest_download_file, info.to_download_dict())
-
-    def save_recent_index_list(self, indexes: list[VersionIndex]):
-        _prepare_parent_dir(self.recent_index_file)
-        _dump_json(self.recent_index_file, [i.to_dict() for i in indexes])
-
-    def save_version_index_file(self, version_codes: list[int]):
-        _prepare_parent_dir(self.recent_index_file)
-        _dump_json(self.versions_index_file, version_codes)
+    def save_latest_download_info(self, info: VersionInfo) -> int:
+        return self._save_json(self.latest_download_file, info.to_download_dict())
+
+    def save_recent_index_list(self, indexes: list[VersionIndex]) -> int:
+        return self._save_json(self.recent_index_file, [i.to_dict() for i in indexes])
+
+    def _save_version_index_pages(self, page_size: int) -> int:
+        index_dir = self.versions_index_file
+        if os.path.isfile(index_dir):
+            self._delete_file(index_dir)
+        changed, pages = 0, []
+        for page_number, page in enumerate(self._store.pages(page_size)):
+            changed += self._save_json(os.path.join(index_dir, str(page_number)), page)
+            pages.append({"first": page[0], "last": page[-1]})
+        header = {"pageSize": page_size, "pageCount": len(pages), "total": len(self._store), "order": "ascending", "pages": pages}
+        if len(self._archive) > 0:
+            header["archives"] = self._archive.ranges()
+        changed += self._save_json(os.path.join(index_dir, self._VERSIONS_INDEX_HEADER_FILE), header)
+        for name in os.listdir(index_dir):
+            if name.isdigit() and int(name) >= len(pages):
+                changed += self._delete_file(os.path.join(index_dir, name))
+        return changed
+
+    def save_version_index_file(self) -> int:
+        page_size = self._config.version_index_page_size
+        if page_size is not None:
+            return self._save_version_index_pages(page_size)
+        if os.path.isdir(self.versions_index_file):
+            shutil.rmtree(self.versions_index_file)
+            self._manifest.remove_prefix(self.versions_index_file)
+        return self._save_json(self.versions_index_file, self._store.versions())
+
+    def writes_update_answers(self) -> bool:
+        if self._requested_config.update_answers is False:
+            return False
+        # Answers already served are kept current even by runs that never enabled them, stale answers are worse than none
+        return self._config.update_answers or os.path.isdir(self.update_answers_dir)
+
+    def delete_update_answers(self) -> int:
+        if not os.path.isdir(self.update_answers_dir):
+            return 0
+        changed = self._delete_files_except(self.update_answers_dir, set())
+        shutil.rmtree(self.update_answers_dir, ignore_errors=True)
+        return changed
+
+    def save_update_answers(self, answers: dict[int, dict]) -> int:
+        changed = sum(self._save_json(os.path.join(self.update_answers_dir, str(k)), v) for k, v in answers.items())
+        if os.path.isdir(self.update_answers_dir):
+            for name in os.listdir(self.update_answers_dir):
+                if name.isdigit() and int(name) not in answers:
+                    changed += self._delete_file(os.path.join(self.update_answers_dir, name))
+        return changed
+
+    def retain_cached_version_codes(self, version_codes: list[int]):
+        self._store.retain(version_codes)
+
+    def is_archived(self, version_code: int) -> bool:
+        return version_code not in self._store and version_code in self._archive
+
+    def list_archive_ranges(self) -> list[dict]:
+        return self._archive.ranges()
+
+    def list_archived_version_indexes(self) -> list[VersionIndex]:
+        return self._archive.indexes()
+
+    def version_mtime(self, version_code: int) -> Optional[float]:
+        try:
+            return os.stat(self.version_file(version_code)).st_mtime
+        except FileNotFoundError:
+            return None
 
-    def delete_latest_files(self):
-        os.remove(self.latest_file)
-        os.remove(self.latest_download_file)
+    def product_summary(self) -> dict:
+        summary = empty_product_summary()
+        summary["versionCount"] = len(self._store) + len(self._archive)
+        latest_version_code = self._store.latest()
+        latest_version_info = self._store.get(latest_version_code) if latest_version_code is not None else None
+        if latest_version_info is not None:
+            summary.update(latestVersionCode=latest_version_code, latestVersionName=latest_version_info.version_name, forceUpdate=latest_version_info.force_update)
+        return summary
+
+    def product_mtime(self) -> float:
+        for path in [self.latest_file, self.versions_index_file, self.product_root]:
+            try:
+                return os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+        return 0.0
+
+    def _archive_bundle_size(self) -> int:
+        # No bundle exceeds the size its compaction used, so regrouping after a single removal never splits one needlessly
+        ranges = self._archive.ranges()
+        return max([i["count"] for i in ranges], default=self._DEFAULT_ARCHIVE_BUNDLE_SIZE)
+
+    def _save_archive(self, plan: ArchivePlan) -> int:
+        changed = sum(self._save_json(self._archive.bundle_file(k), v) for k, v in plan.bundles.items())
+        changed += sum(self._delete_file(self._archive.bundle_file(i)) for i in plan.deleted)
+        index_file = os.path.join(self.archive_dir, self._ARCHIVE_INDEX_FILE)
+        if len(plan.index) > 0:
+            changed += self._save_json(index_file, plan.index)
+        elif os.path.exists(index_file):
+            changed += self._delete_file(index_file)
+        self._archive.applied()
+        return changed
+
+    def archive_versions(self, infos: list[VersionInfo], bundle_size: int) -> int:
+        archived_codes = {i.version_code for i in infos}
+        active_codes = {i for i in self._store.versions() if i not in archived_codes}
+        # Bundles are written before the versions leave the store, so an interrupted run only leaves duplicates behind
+        changed = self._save_archive(self._archive.plan(infos, set(), active_codes, bundle_size))
+        for version_code in sorted(archived_codes):
+            changed += self.delete_version_code_version_info(version_code)
+        return changed
+
+    def revalidate(self):
+        self._archive.revalidate()
+        saved_options = ProductOptions.load(self.options_file)
+        if saved_options != self._saved_options:
+            self._saved_options = saved_options
+            self._exported_slim_versions = saved_options.slim_versions
+            storage = self._options.storage
+            self._options = self._resolve_options(saved_options)
+            self._config = self._options.apply(self._requested_config)
+            if self._options.storage != storage:
+                # Another process migrated the product, so its versions are read from the new backend
+                self._store = self._open_store()
+        layout = VersionLayout.load(self.layout_file)
+        if layout != self._layout:
+            # Another process resharded the product, so paths and the catalog follow its layout
+            self._layout = layout
+            if self._store.materialized:
+                self._store = self._open_store()
+        self._store.revalidate()
+        self._manifest.revalidate()
+
+    def flush(self):
+        if self._options != self._saved_options:
+            self._options.save(self.options_file)
+            self._saved_options = self._options
+        self._store.save()
+        self._manifest.save(self._config.sync_headers)
+
+    def list_version_compats(self) -> list[tuple[int, VersionCompat]]:
+        return self._store.compats()
+
+    def has_compat_latest_files(self) -> bool:
+        return os.path.isdir(self.compat_dir)
+
+    def save_compat_latest_files(self, answers: dict[tuple[str, str, int], VersionInfo], header: dict) -> int:
+        live_files = {os.path.join(self.compat_dir, self._COMPAT_HEADER_FILE)}
+        changed = self._save_json(os.path.join(self.compat_dir, self._COMPAT_HEADER_FILE), header)
+        for (channel, abi, sdk), info in answers.items():
+            answer_dir = os.path.join(self.compat_dir, channel, abi, str(sdk))
+            latest_file, latest_download_file = os.path.join(answer_dir, self._LATEST_FILE), os.path.join(answer_dir, self._LATEST_DOWNLOAD_FILE)
+            changed += self._save_json(latest_file, self._version_content(info)) + self._save_json(latest_download_file, info.to_download_dict())
+            live_files.update([latest_file, latest_download_file])
+        return changed + self._delete_files_except(self.compat_dir, live_files)
+
+    def delete_compat_latest_files(self) -> int:
+        if not self.has_compat_latest_files():
+            return 0
+        changed = self._delete_files_except(self.compat_dir, set())
+        shutil.rmtree(self.compat_dir, ignore_errors=True)
+        return changed
+
+    def _delete_files_except(self, folder: str, live_files: set[str]) -> int:
+        changed = 0
+        for root, dirs, names in os.walk(folder, topdown=False):
+            for name in names:
+                path = os.path.join(root, name)
+                if path not in live_files and not name.endswith((self._GZIP_SUFFIX, self._BROTLI_SUFFIX)):
+                    changed += self._delete_file(path)
+            if root != folder and len(os.listdir(root)) == 0:
+                os.rmdir(root)
+        return changed
+
+    def delete_latest_files(self) -> int:
+        return sum([self._delete_file(self.latest_file), self._delete_file(self.latest_download_file)])
 
     @staticmethod
     def has_product(source_root: str, product: str) -> bool:
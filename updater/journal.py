@@ -0,0 +1,148 @@
+import os
+import json
+import uuid
+from typing import BinaryIO, Optional
+
+from .utils import serialize_json, prepare_parent_dir
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _lock_file(fd: int, blocking: bool = True) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class ProductLock:
+    def __init__(self, path: str):
+        self._path: str = path
+        self._fd: Optional[int] = None
+        self._depth: int = 0
+        self._generation: Optional[bytes] = None
+        self._stale: bool = True
+
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._depth == 0:
+            prepare_parent_dir(self._path)
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o666)
+            if not _lock_file(fd, blocking):
+                os.close(fd)
+                return False
+            self._fd = fd
+            # Every holder stamps a new generation, so a changed one means another writer touched the product
+            generation = os.read(fd, 32)
+            self._stale = generation != self._generation
+            self._generation = uuid.uuid4().hex.encode("ascii")
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, self._generation)
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the descriptor drops the flock
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "ProductLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class OperationJournal:
+    _OPERATIONS = {"save": "version", "delete": "code"}
+
+    def __init__(self, path: str):
+        self._path: str = path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def has_entries(self) -> bool:
+        try:
+            return os.stat(self._path).st_size > 0
+        except FileNotFoundError:
+            return False
+
+    def _open_locked(self, mode: str) -> BinaryIO:
+        prepare_parent_dir(self._path)
+        f = open(self._path, mode)
+        _lock_file(f.fileno())
+        return f
+
+    @staticmethod
+    def _sync(f: BinaryIO):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def append(self, operations: list[dict]) -> set[str]:
+        if len(operations) == 0:
+            return set()
+        entries = [{"id": uuid.uuid4().hex, **i} for i in operations]
+        data = b"".join(serialize_json(i) + b"\n" for i in entries)
+        with self._open_locked("a+b") as f:
+            # Terminate a torn trailing line so it cannot swallow the new entries
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            self._sync(f)
+        return {i["id"] for i in entries}
+
+    def _is_operation(self, record: dict) -> bool:
+        key = self._OPERATIONS.get(record.get("op"))
+        return key is not None and isinstance(record.get("id"), str) and key in record
+
+    def _pending(self, data: bytes) -> list[dict]:
+        operations: dict[str, dict] = {}
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn line from a crash during append is rolled back by ignoring it
+                continue
+            if not isinstance(record, dict):
+                continue
+            if isinstance(record.get("commit"), list):
+                for i in record["commit"]:
+                    operations.pop(i, None)
+            elif self._is_operation(record):
+                operations[record["id"]] = record
+        return list(operations.values())
+
+    def pending(self) -> list[dict]:
+        try:
+            with open(self._path, "rb") as f:
+                return self._pending(f.read())
+        except FileNotFoundError:
+            return []
+
+    def commit(self, ids: list[str]):
+        if len(ids) == 0:
+            return
+        with self._open_locked("r+b") as f:
+            committed = set(ids)
+            if all(i["id"] in committed for i in self._pending(f.read())):
+                f.truncate(0)
+            else:
+                f.seek(0, os.SEEK_END)
+                f.write(serialize_json({"commit": ids}) + b"\n")
+            self._sync(f)
@@ -0,0 +1,60 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from .utils import load_json, dump_json, prepare_parent_dir
+
+VERSIONS_DIR = "Version"
+SHARDS_DIR = "Shard"
+
+
+def is_version_path(relative_path: str) -> bool:
+    parts = relative_path.split("/")
+    if len(parts) < 2 or parts[0] != VERSIONS_DIR or not parts[-1].split(".")[0].isdigit():
+        return False
+    return len(parts) == 2 or (len(parts) == 4 and parts[1] == SHARDS_DIR and parts[2].isdigit())
+
+
+@dataclass(frozen=True)
+class VersionLayout:
+    shard_size: Optional[int] = None
+    flat_links: bool = False
+
+    @property
+    def sharded(self) -> bool:
+        return self.shard_size is not None
+
+    def bucket(self, version_code: int) -> int:
+        return version_code // self.shard_size
+
+    def relative_path(self, version_code: int) -> str:
+        if self.sharded:
+            return f"{VERSIONS_DIR}/{SHARDS_DIR}/{self.bucket(version_code)}/{version_code}"
+        return f"{VERSIONS_DIR}/{version_code}"
+
+    def relative_paths(self, version_code: int) -> list[str]:
+        # Flat links keep Version/<code> URLs working for clients that predate sharding
+        if self.sharded and self.flat_links:
+            return [self.relative_path(version_code), f"{VERSIONS_DIR}/{version_code}"]
+        return [self.relative_path(version_code)]
+
+    def to_dict(self) -> dict[str, any]:
+        return {"shardSize": self.shard_size, "flatLinks": self.flat_links}
+
+    @staticmethod
+    def load(path: str) -> "VersionLayout":
+        try:
+            data = load_json(path)
+        except FileNotFoundError:
+            return VersionLayout()
+        shard_size = data.get("shardSize")
+        if shard_size is not None and (not isinstance(shard_size, int) or isinstance(shard_size, bool) or shard_size <= 0):
+            raise ValueError(f"{path}: invalid shardSize {shard_size!r}")
+        return VersionLayout(shard_size=shard_size, flat_links=bool(data.get("flatLinks", False)) and shard_size is not None)
+
+    def save(self, path: str):
+        if self.sharded:
+            prepare_parent_dir(path)
+            dump_json(path, self.to_dict())
+        elif os.path.exists(path):
+            os.remove(path)
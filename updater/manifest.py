@@ -0,0 +1,141 @@
+import os
+import hashlib
+from typing import Optional
+
+from .layout import is_version_path
+from .utils import load_json, dump_json, write_bytes, remove_file, prepare_parent_dir
+
+
+class ProductManifest:
+    _FORMAT_VERSION = 1
+    _MANIFEST_FILE = "manifest.json"
+    _CHANGES_FILE = "changes.json"
+    _HEADERS_FILE = "_headers"
+    _VERSION_CACHE_CONTROL = "public, max-age=86400"
+    _MUTABLE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+    _IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+    def __init__(self, product_root: str, manifest_dir: str, url_prefix: Optional[str] = None):
+        self._product_root: str = product_root
+        self._url_prefix: str = url_prefix if url_prefix is not None else f"/{os.path.basename(product_root)}"
+        self._manifest_dir: str = manifest_dir
+        self._entries: Optional[dict[str, dict]] = None
+        self._dirty: bool = False
+        self._loaded_mtime_ns: Optional[int] = None
+        self._added: set[str] = set()
+        self._changed: set[str] = set()
+        self._removed: set[str] = set()
+
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(self._manifest_dir, self._MANIFEST_FILE)
+
+    @property
+    def changes_file(self) -> str:
+        return os.path.join(self._manifest_dir, self._CHANGES_FILE)
+
+    @property
+    def headers_file(self) -> str:
+        return os.path.join(self._manifest_dir, self._HEADERS_FILE)
+
+    def _file_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.manifest_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def revalidate(self):
+        if self._entries is not None and not self._dirty and self._file_mtime_ns() != self._loaded_mtime_ns:
+            self._entries = None
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            self._entries = {}
+            self._loaded_mtime_ns = self._file_mtime_ns()
+            if self._loaded_mtime_ns is not None:
+                try:
+                    data = load_json(self.manifest_file)
+                except (OSError, ValueError):
+                    data = None
+                if isinstance(data, dict) and data.get("format") == self._FORMAT_VERSION:
+                    self._entries = data.get("files", {})
+        return self._entries
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self._product_root).replace(os.sep, "/")
+
+    @property
+    def entries(self) -> dict[str, dict]:
+        return self._load()
+
+    def get(self, path: str) -> Optional[dict]:
+        return self._load().get(self._relative(path))
+
+    def record(self, path: str, data: bytes):
+        relative_path = self._relative(path)
+        sha256 = hashlib.sha256(data).hexdigest()
+        mtime_ns = os.stat(path).st_mtime_ns
+        old_entry = self._load().get(relative_path)
+        if old_entry is not None and old_entry["sha256"] == sha256:
+            if old_entry["mtime"] != mtime_ns:
+                old_entry["mtime"] = mtime_ns
+                self._dirty = True
+            return
+        if old_entry is None:
+            if relative_path in self._removed:
+                self._removed.discard(relative_path)
+                self._changed.add(relative_path)
+            else:
+                self._added.add(relative_path)
+        elif relative_path not in self._added:
+            self._changed.add(relative_path)
+        self._entries[relative_path] = {"sha256": sha256, "size": len(data), "etag": f'"{sha256[:32]}"', "mtime": mtime_ns}
+        self._dirty = True
+
+    def remove(self, path: str):
+        relative_path = self._relative(path)
+        if self._load().pop(relative_path, None) is not None:
+            if relative_path in self._added:
+                self._added.discard(relative_path)
+            else:
+                self._changed.discard(relative_path)
+                self._removed.add(relative_path)
+            self._dirty = True
+
+    def remove_prefix(self, path: str):
+        prefix = self._relative(path) + "/"
+        for relative_path in [i for i in self._load() if i.startswith(prefix)]:
+            self.remove(os.path.join(self._product_root, relative_path))
+
+    @staticmethod
+    def cache_control(relative_path: str) -> str:
+        if is_version_path(relative_path):
+            return ProductManifest._VERSION_CACHE_CONTROL
+        parts = relative_path.split("/")
+        if len(parts) == 2 and parts[0] == "Changelog":
+            return ProductManifest._IMMUTABLE_CACHE_CONTROL
+        return ProductManifest._MUTABLE_CACHE_CONTROL
+
+    def _headers(self) -> bytes:
+        lines = []
+        for relative_path, entry in sorted(self._load().items()):
+            lines.append(f"{self._url_prefix}/{relative_path}")
+            lines.append(f"  ETag: {entry['etag']}")
+            lines.append(f"  Cache-Control: {self.cache_control(relative_path)}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def save(self, headers: Optional[bool] = None):
+        prepare_parent_dir(self.manifest_file)
+        if self._dirty:
+            dump_json(self.manifest_file, {"format": self._FORMAT_VERSION, "files": self._load()})
+            self._loaded_mtime_ns = self._file_mtime_ns()
+        dump_json(self.changes_file, {"added": sorted(self._added), "changed": sorted(self._changed), "removed": sorted(self._removed)})
+        # Without an explicit choice an existing _headers is kept in sync, as stale ETags are worse than none
+        if headers is None:
+            headers = os.path.exists(self.headers_file)
+        if headers and (self._dirty or not os.path.exists(self.headers_file)):
+            write_bytes(self.headers_file, self._headers())
+        elif not headers:
+            remove_file(self.headers_file)
+        self._dirty = False
+        self._added, self._changed, self._removed = set(), set(), set()
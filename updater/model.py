@@ -1,25 +1,68 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Optional
 
 
-@dataclass
+class ModelDecodeError(ValueError):
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+        self.path: str = path
+
+
+def _decode_field(data: Any, key: str, expected: type, path: str) -> Any:
+    if not isinstance(data, dict):
+        raise ModelDecodeError(path, f"expected object, got {type(data).__name__}")
+    if key not in data:
+        raise ModelDecodeError(f"{path}.{key}", "required key is missing")
+    value = data[key]
+    # bool is a subclass of int, but a boolean version code is always a mistake
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        raise ModelDecodeError(f"{path}.{key}", f"expected {expected.__name__}, got {type(value).__name__}")
+    return value
+
+
+def _decode_optional_field(data: Any, key: str, expected: type, path: str) -> Any:
+    if isinstance(data, dict) and data.get(key) is None:
+        return None
+    return _decode_field(data, key, expected, path)
+
+
+# Every compatibility answer is emitted for these ABIs, so a device always finds its own file
+KNOWN_ABIS = ("arm64-v8a", "armeabi-v7a", "x86", "x86_64")
+DEFAULT_CHANNEL = "default"
+
+
+@dataclass(frozen=True, slots=True)
 class DownloadSource:
     source_name: str
     url: str
     is_direct_link: bool
+    size: Optional[int] = None
+    sha256: Optional[str] = None
 
     def to_dict(self) -> dict[str, any]:
-        return {"sourceName": self.source_name, "url": self.url, "isDirectLink": self.is_direct_link}
+        data = {"sourceName": self.source_name, "url": self.url, "isDirectLink": self.is_direct_link}
+        if self.size is not None:
+            data["size"] = self.size
+        if self.sha256 is not None:
+            data["sha256"] = self.sha256
+        return data
 
     @staticmethod
     def empty_instance() -> "DownloadSource":
         return DownloadSource(source_name="", url="", is_direct_link=True)
 
     @staticmethod
-    def from_dict(data: dict) -> "DownloadSource":
-        return DownloadSource(source_name=data["sourceName"], url=data["url"], is_direct_link=data["isDirectLink"])
+    def from_dict(data: dict, path: str = "$") -> "DownloadSource":
+        return DownloadSource(
+            source_name=_decode_field(data, "sourceName", str, path),
+            url=_decode_field(data, "url", str, path),
+            is_direct_link=_decode_field(data, "isDirectLink", bool, path),
+            size=_decode_optional_field(data, "size", int, path),
+            sha256=_decode_optional_field(data, "sha256", str, path),
+        )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VersionIndex:
     version: int
     force_update: bool
@@ -28,17 +71,61 @@ class VersionIndex:
         return {"version": self.version, "forceUpdate": self.force_update}
 
     @staticmethod
-    def from_dict(data: dict) -> "VersionIndex":
-        return VersionIndex(version=data["version"], force_update=data["forceUpdate"])
+    def from_dict(data: dict, path: str = "$") -> "VersionIndex":
+        return VersionIndex(version=_decode_field(data, "version", int, path), force_update=_decode_field(data, "forceUpdate", bool, path))
+
+    @staticmethod
+    def from_version_dict(data: dict, path: str = "$") -> "VersionIndex":
+        return VersionIndex(version=_decode_field(data, "versionCode", int, path), force_update=_decode_field(data, "forceUpdate", bool, path))
+
+
+@dataclass(frozen=True, slots=True)
+class VersionCompat:
+    min_sdk: Optional[int] = None
+    abis: tuple[str, ...] = ()
+    channel: Optional[str] = None
+
+    def is_constrained(self) -> bool:
+        return self.min_sdk is not None or len(self.abis) > 0 or self.channel is not None
+
+    def matches(self, channel: str, abi: str, sdk: int) -> bool:
+        return (
+            (self.channel is None or self.channel == channel)
+            and (len(self.abis) == 0 or abi in self.abis)
+            and (self.min_sdk is None or self.min_sdk <= sdk)
+        )
+
+    def to_dict(self) -> dict[str, any]:
+        data = {}
+        if self.min_sdk is not None:
+            data["minSdk"] = self.min_sdk
+        if len(self.abis) > 0:
+            data["abis"] = list(self.abis)
+        if self.channel is not None:
+            data["channel"] = self.channel
+        return data
+
+    @staticmethod
+    def from_dict(data: dict, path: str = "$") -> "VersionCompat":
+        abis = _decode_optional_field(data, "abis", list, path) or []
+        for i, abi in enumerate(abis):
+            if not isinstance(abi, str):
+                raise ModelDecodeError(f"{path}.abis[{i}]", f"expected str, got {type(abi).__name__}")
+        return VersionCompat(
+            min_sdk=_decode_optional_field(data, "minSdk", int, path),
+            abis=tuple(abis),
+            channel=_decode_optional_field(data, "channel", str, path),
+        )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VersionInfo:
     version_code: int
     version_name: str
     force_update: bool
     change_log: str
-    download_source: list[DownloadSource]
+    download_source: tuple[DownloadSource, ...]
+    compat: VersionCompat = VersionCompat()
 
     def to_dict(self) -> dict[str, any]:
         return {
@@ -47,6 +134,18 @@ class VersionInfo:
             "forceUpdate": self.force_update,
             "changeLog": self.change_log,
             "downloadSource": [i.to_dict() for i in self.download_source],
+            **self.compat.to_dict(),
+        }
+
+    def to_slim_dict(self, change_log_hash: str, change_log_url: str) -> dict[str, any]:
+        return {
+            "versionCode": self.version_code,
+            "versionName": self.version_name,
+            "forceUpdate": self.force_update,
+            "changeLogHash": change_log_hash,
+            "changeLogUrl": change_log_url,
+            "downloadSource": [i.to_dict() for i in self.download_source],
+            **self.compat.to_dict(),
         }
 
     def to_index(self) -> VersionIndex:
@@ -60,22 +159,38 @@ class VersionInfo:
                 recommend_source = direct_sources[0]
             else:
                 recommend_source = self.download_source[0]
-        return {
+        data = {
             "versionCode": self.version_code,
             "versionName": self.version_name,
             "url": recommend_source.url if recommend_source is not None else None,
         }
+        if recommend_source is not None and recommend_source.size is not None:
+            data["size"] = recommend_source.size
+        if recommend_source is not None and recommend_source.sha256 is not None:
+            data["sha256"] = recommend_source.sha256
+        return data
+
+    def with_checksum(self, size: int, sha256: str) -> "VersionInfo":
+        # Direct links serve the artifact itself, while other sources point at pages the client never verifies
+        return replace(self, download_source=tuple(replace(i, size=size, sha256=sha256) if i.is_direct_link else i for i in self.download_source))
 
     @staticmethod
     def empty_instance() -> "VersionInfo":
-        return VersionInfo(version_code=0, version_name="", force_update=False, change_log="", download_source=[DownloadSource.empty_instance()])
+        return VersionInfo(version_code=0, version_name="", force_update=False, change_log="", download_source=(DownloadSource.empty_instance(),))
 
     @staticmethod
-    def from_dict(data: dict) -> "VersionInfo":
+    def from_dict(data: dict, path: str = "$", change_log_loader: Optional[Callable[[str], str]] = None) -> "VersionInfo":
+        download_source = _decode_field(data, "downloadSource", list, path)
+        if change_log_loader is not None and isinstance(data, dict) and "changeLog" not in data:
+            # Slim versions only reference their change log blob, which is read here and nowhere earlier
+            change_log = change_log_loader(_decode_field(data, "changeLogHash", str, path))
+        else:
+            change_log = _decode_field(data, "changeLog", str, path)
         return VersionInfo(
-            version_code=data["versionCode"],
-            version_name=data["versionName"],
-            force_update=data["forceUpdate"],
-            change_log=data["changeLog"],
-            download_source=[DownloadSource.from_dict(i) for i in data["downloadSource"]],
+            version_code=_decode_field(data, "versionCode", int, path),
+            version_name=_decode_field(data, "versionName", str, path),
+            force_update=_decode_field(data, "forceUpdate", bool, path),
+            change_log=change_log,
+            download_source=tuple(DownloadSource.from_dict(v, f"{path}.downloadSource[{i}]") for i, v in enumerate(download_source)),
+            compat=VersionCompat.from_dict(data, path),
         )
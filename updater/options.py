@@ -0,0 +1,106 @@
+import os
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+
+from .config import OutputConfig
+from .utils import load_json, dump_json, prepare_parent_dir
+
+
+@dataclass(frozen=True)
+class ProductOptions:
+    precompress: bool = False
+    gzip_level: int = 9
+    brotli_quality: int = 11
+    sync_headers: Optional[bool] = None
+    version_index_page_size: Optional[int] = None
+    update_answers: bool = False
+    storage: Optional[str] = None
+    slim_versions: Optional[bool] = None
+
+    def resolve(self, config: OutputConfig) -> "ProductOptions":
+        # Options given for this run override the stored ones and are kept for later runs
+        changes = {}
+        for key in ("precompress", "gzip_level", "brotli_quality", "sync_headers"):
+            if getattr(config, key) is not None:
+                changes[key] = getattr(config, key)
+        if config.version_index_page_size is not None:
+            changes["version_index_page_size"] = config.version_index_page_size if config.version_index_page_size > 0 else None
+        if config.update_answers is not None:
+            changes["update_answers"] = config.update_answers
+        if config.slim_versions is not None:
+            changes["slim_versions"] = config.slim_versions
+        if config.storage is not None and config.storage != self.storage:
+            # Switching backends needs the versions moved over, which only migrate does
+            if self.storage is not None:
+                raise ValueError(f"versions are kept in {self.storage} storage, not {config.storage}" + (", run migrate to move them" if config.storage == "sqlite" else ""))
+            changes["storage"] = config.storage
+        return dataclasses.replace(self, **changes)
+
+    def apply(self, config: OutputConfig) -> OutputConfig:
+        return dataclasses.replace(
+            config,
+            precompress=self.precompress,
+            gzip_level=self.gzip_level,
+            brotli_quality=self.brotli_quality,
+            sync_headers=self.sync_headers,
+            version_index_page_size=self.version_index_page_size,
+            update_answers=self.update_answers,
+            storage=self.storage or "files",
+            slim_versions=bool(self.slim_versions),
+        )
+
+    def to_dict(self) -> dict[str, any]:
+        return {
+            "precompress": self.precompress,
+            "gzipLevel": self.gzip_level,
+            "brotliQuality": self.brotli_quality,
+            "syncHeaders": self.sync_headers,
+            "indexPageSize": self.version_index_page_size,
+            "updateAnswers": self.update_answers,
+            "storage": self.storage,
+            "slimVersions": self.slim_versions,
+        }
+
+    @staticmethod
+    def _level(data: dict, key: str, default: int, lowest: int, highest: int, path: str) -> int:
+        value = data.get(key, default)
+        if not isinstance(value, int) or isinstance(value, bool) or not lowest <= value <= highest:
+            raise ValueError(f"{path}: invalid {key} {value!r}")
+        return value
+
+    @staticmethod
+    def load(path: str) -> "ProductOptions":
+        try:
+            data = load_json(path)
+        except FileNotFoundError:
+            return ProductOptions()
+        page_size = data.get("indexPageSize")
+        if page_size is not None and (not isinstance(page_size, int) or isinstance(page_size, bool) or page_size <= 0):
+            raise ValueError(f"{path}: invalid indexPageSize {page_size!r}")
+        storage = data.get("storage")
+        if storage not in (None, "files", "sqlite"):
+            raise ValueError(f"{path}: invalid storage {storage!r}")
+        slim_versions = data.get("slimVersions")
+        if slim_versions is not None and not isinstance(slim_versions, bool):
+            raise ValueError(f"{path}: invalid slimVersions {slim_versions!r}")
+        sync_headers = data.get("syncHeaders")
+        if sync_headers is not None and not isinstance(sync_headers, bool):
+            raise ValueError(f"{path}: invalid syncHeaders {sync_headers!r}")
+        return ProductOptions(
+            precompress=bool(data.get("precompress", False)),
+            gzip_level=ProductOptions._level(data, "gzipLevel", 9, 1, 9, path),
+            brotli_quality=ProductOptions._level(data, "brotliQuality", 11, 0, 11, path),
+            sync_headers=sync_headers,
+            version_index_page_size=page_size,
+            update_answers=bool(data.get("updateAnswers", False)),
+            storage=storage,
+            slim_versions=slim_versions,
+        )
+
+    def save(self, path: str):
+        if self != ProductOptions():
+            prepare_parent_dir(path)
+            dump_json(path, self.to_dict())
+        elif os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,107 @@
+import os
+import time
+from typing import Optional
+
+from .journal import ProductLock
+from .manifest import ProductManifest
+from .utils import load_json, serialize_json, write_bytes, prepare_parent_dir
+
+_SUMMARY_KEYS = ("latestVersionCode", "latestVersionName", "versionCount", "forceUpdate")
+
+
+def empty_product_summary() -> dict:
+    return {"latestVersionCode": None, "latestVersionName": None, "versionCount": 0, "forceUpdate": False}
+
+
+class ProductCatalog:
+    _INDEX_FILE = "Index"
+    _SYNC_DIR = ".sync"
+    _LOCK_FILE = "products.lock"
+
+    def __init__(self, source_root: str, sync_headers: Optional[bool] = None):
+        self._source_root: str = source_root
+        # Turning headers off is a per product choice, while existing root headers are still kept in sync
+        self._sync_headers: Optional[bool] = sync_headers or None
+        self._lock: ProductLock = ProductLock(os.path.join(source_root, self._SYNC_DIR, self._LOCK_FILE))
+        # The catalog is served from the root, so its manifest and change list sit in the root .sync dir
+        self._manifest: ProductManifest = ProductManifest(source_root, os.path.join(source_root, self._SYNC_DIR), url_prefix="")
+        self._entries: Optional[dict[str, dict]] = None
+        self._loaded_mtime_ns: Optional[int] = None
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self._source_root, self._INDEX_FILE)
+
+    def _file_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.index_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def exists(self) -> bool:
+        return self._file_mtime_ns() is not None
+
+    def _load(self) -> dict[str, dict]:
+        mtime_ns = self._file_mtime_ns()
+        if self._entries is None or mtime_ns != self._loaded_mtime_ns:
+            self._loaded_mtime_ns = mtime_ns
+            try:
+                data = load_json(self.index_file) if mtime_ns is not None else []
+            except ValueError:
+                data = []
+            self._entries = {i["product"]: i for i in data if isinstance(i, dict) and isinstance(i.get("product"), str)} if isinstance(data, list) else {}
+        return self._entries
+
+    def _save(self, entries: dict[str, dict]) -> bool:
+        prepare_parent_dir(self.index_file)
+        data = serialize_json([entries[i] for i in sorted(entries)])
+        changed = write_bytes(self.index_file, data)
+        self._entries = entries
+        self._loaded_mtime_ns = self._file_mtime_ns()
+        self._manifest.revalidate()
+        if changed or self._manifest.get(self.index_file) is None:
+            self._manifest.record(self.index_file, data)
+        self._manifest.save(self._sync_headers)
+        return changed
+
+    def summaries(self) -> list[dict]:
+        entries = self._load()
+        return [entries[i] for i in sorted(entries)]
+
+    def products(self) -> list[str]:
+        return sorted(self._load())
+
+    @staticmethod
+    def _entry(product: str, summary: dict) -> dict:
+        return {"product": product, **{i: summary[i] for i in _SUMMARY_KEYS}, "modified": int(time.time() * 1000)}
+
+    def update(self, product: str, summary: dict, touched: bool = True) -> bool:
+        old_entry = self._load().get(product)
+        if old_entry is not None and not touched and all(old_entry.get(i) == summary[i] for i in _SUMMARY_KEYS):
+            # Refreshes that changed nothing leave the catalog and its modified time alone
+            return False
+        with self._lock:
+            # Other products are updated by other writers, so the entry is merged into the latest catalog
+            entries = dict(self._load())
+            entries[product] = self._entry(product, summary)
+            return self._save(entries)
+
+    def retain(self, products: list[str]) -> bool:
+        if all(i in products for i in self._load()):
+            return False
+        with self._lock:
+            entries = {k: v for k, v in self._load().items() if k in products}
+            return self._save(entries)
+
+    def rebuild(self, summaries: dict[str, tuple[dict, float]]) -> int:
+        with self._lock:
+            old_entries = self._load()
+            entries = {}
+            for product, (summary, mtime) in summaries.items():
+                old_entry = old_entries.get(product)
+                if old_entry is not None and all(old_entry.get(i) == summary[i] for i in _SUMMARY_KEYS):
+                    entries[product] = old_entry
+                else:
+                    entries[product] = {**self._entry(product, summary), "modified": int(mtime * 1000)}
+            self._save(entries)
+        return len(entries)
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+from typing import Callable, Optional
+
+_active: Optional["IOProfiler"] = None
+
+
+class _OperationStats:
+    __slots__ = ("count", "seconds", "bytes")
+
+    def __init__(self):
+        self.count: int = 0
+        self.seconds: float = 0.0
+        self.bytes: int = 0
+
+
+class IOProfiler:
+    _PATCHED_OS_FUNCTIONS = {"stat": "stat", "listdir": "list", "scandir": "list"}
+
+    def __init__(self, trace: bool = False):
+        self._trace: bool = trace
+        self._origin: float = time.perf_counter()
+        self._operations: dict[str, _OperationStats] = {}
+        self._events: list[dict] = []
+        self._files_read: set[str] = set()
+        self._files_written: set[str] = set()
+        self._restore: list[tuple[object, str, object]] = []
+
+    def record(self, operation: str, category: str, start: float, path: Optional[str] = None, size: int = 0, written: bool = False):
+        end = time.perf_counter()
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = _OperationStats()
+        stats.count += 1
+        stats.seconds += end - start
+        stats.bytes += size
+        if path is not None and size > 0:
+            (self._files_written if written else self._files_read).add(path)
+        if self._trace:
+            event = {"name": operation, "cat": category, "ph": "X", "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6}
+            event.update(pid=os.getpid(), tid=threading.get_ident())
+            if path is not None:
+                event["args"] = {"path": path}
+            self._events.append(event)
+
+    def _wrap(self, function: Callable, operation: str, category: str) -> Callable:
+        @functools.wraps(function)
+        def _wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(operation, category, start, os.fspath(args[0]) if len(args) > 0 and isinstance(args[0], (str, os.PathLike)) else None)
+
+        return _wrapper
+
+    def _patch(self, owner: object, name: str, wrapper: Callable):
+        self._restore.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, wrapper)
+
+    def install(self, classes: list[type]):
+        global _active
+        for name, operation in self._PATCHED_OS_FUNCTIONS.items():
+            self._patch(os, name, self._wrap(getattr(os, name), operation, "fs"))
+        for cls in classes:
+            for name, member in list(cls.__dict__.items()):
+                if name.startswith("_"):
+                    continue
+                function = member.__func__ if isinstance(member, staticmethod) else member
+                if not inspect.isfunction(function):
+                    continue
+                wrapper = self._wrap(function, f"{cls.__name__}.{name}", "method")
+                self._patch(cls, name, staticmethod(wrapper) if isinstance(member, staticmethod) else wrapper)
+        _active = self
+
+    def uninstall(self):
+        global _active
+        _active = None
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore.clear()
+
+    def summary(self) -> dict:
+        empty = _OperationStats()
+        return {
+            "wall_time": time.perf_counter() - self._origin,
+            "files_read": len(self._files_read),
+            "files_written": len(self._files_written),
+            "bytes_read": self._operations.get("read", empty).bytes,
+            "bytes_written": self._operations.get("write", empty).bytes,
+            "operations": {k: {"count": v.count, "seconds": v.seconds, "bytes": v.bytes} for k, v in sorted(self._operations.items())},
+        }
+
+    def dump_summary(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def dump_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, f)
+
+
+def profiled(operation: str, size: Optional[Callable[..., int]] = None, written: bool = False) -> Callable[[Callable], Callable]:
+    def _decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def _wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            profiler.record(operation, "io", start, args[0] if len(args) > 0 and isinstance(args[0], str) else None, size(result, *args) if size else 0, written)
+            return result
+
+        return _wrapper
+
+    return _decorator
@@ -0,0 +1,193 @@
+import os
+import gzip
+import hashlib
+import threading
+from urllib.parse import urlsplit, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .io import UpdateFileManager
+from .manifest import ProductManifest
+from .products import ProductCatalog
+
+
+class ServedFile:
+    __slots__ = ("stat_key", "body", "gzip_body", "etag", "gzip_etag", "cache_control")
+
+    def __init__(self, stat_key: tuple[int, int], body: bytes, etag: str, cache_control: str):
+        self.stat_key: tuple[int, int] = stat_key
+        self.body: bytes = body
+        self.etag: str = etag
+        self.cache_control: str = cache_control
+        gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+        self.gzip_body: Optional[bytes] = gzip_body if len(gzip_body) < len(body) else None
+        self.gzip_etag: str = etag[:-1] + '-gzip"'
+
+
+class UpdateSnapshot:
+    def __init__(self, source_root: str, products: Optional[list[str]] = None):
+        self._source_root: str = source_root
+        self._products: Optional[list[str]] = products
+        self._signatures: dict[str, tuple] = {}
+        self._product_files: dict[str, dict[str, ServedFile]] = {}
+        self._catalog_file: Optional[ServedFile] = None
+        self._files: dict[str, ServedFile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url_path: str) -> Optional[ServedFile]:
+        return self._files.get(url_path)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def _products_to_serve(self) -> list[str]:
+        products = UpdateFileManager.get_products(self._source_root)
+        return products if self._products is None else [i for i in products if i in self._products]
+
+    @staticmethod
+    def _signature(files: UpdateFileManager) -> tuple:
+        signature = []
+        for path in [files.product_root, files.versions_dir, files.versions_index_file, files.manifest_file]:
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @staticmethod
+    def _load_product(files: UpdateFileManager, old_files: dict[str, ServedFile]) -> dict[str, ServedFile]:
+        served_files = {}
+        for path in files.list_served_files():
+            relative_path = os.path.relpath(path, files.product_root).replace(os.sep, "/")
+            url_path = f"/{files.product_name}/{relative_path}"
+            try:
+                stat = os.stat(path)
+                stat_key = (stat.st_mtime_ns, stat.st_size)
+                old_file = old_files.get(url_path)
+                if old_file is not None and old_file.stat_key == stat_key:
+                    served_files[url_path] = old_file
+                    continue
+                with open(path, "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                continue
+            entry = files.manifest_entry(path)
+            if entry is not None and entry["mtime"] == stat.st_mtime_ns and entry["size"] == len(body):
+                etag = entry["etag"]
+            else:
+                etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            served_files[url_path] = ServedFile(stat_key, body, etag, ProductManifest.cache_control(relative_path))
+        return served_files
+
+    def _reload_catalog(self) -> bool:
+        path = ProductCatalog(self._source_root).index_file
+        try:
+            stat = os.stat(path)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if self._catalog_file is not None and self._catalog_file.stat_key == stat_key:
+                return False
+            with open(path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            changed = self._catalog_file is not None
+            self._catalog_file = None
+            return changed
+        self._catalog_file = ServedFile(stat_key, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', ProductManifest.cache_control(""))
+        return True
+
+    def reload(self) -> bool:
+        with self._lock:
+            changed = self._reload_catalog()
+            products = self._products_to_serve()
+            for product in list(self._product_files):
+                if product not in products:
+                    del self._product_files[product]
+                    del self._signatures[product]
+                    changed = True
+            for product in products:
+                try:
+                    files = UpdateFileManager(self._source_root, product)
+                except FileNotFoundError:
+                    continue
+                signature = self._signature(files)
+                if self._signatures.get(product) != signature:
+                    self._product_files[product] = self._load_product(files, self._product_files.get(product, {}))
+                    self._signatures[product] = signature
+                    changed = True
+            if changed:
+                served_files = {"/Index": self._catalog_file} if self._catalog_file is not None else {}
+                for product_files in self._product_files.values():
+                    served_files.update(product_files)
+                self._files = served_files
+            return changed
+
+
+class UpdateRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "UpdateServer"
+
+    def _send_empty(self, code: int, headers: dict[str, str]):
+        self.send_response(code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _respond(self, with_body: bool):
+        served_file = self.server.snapshot.get(unquote(urlsplit(self.path).path))
+        if served_file is None:
+            self._send_empty(404, {})
+            return
+        use_gzip = served_file.gzip_body is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = served_file.gzip_etag if use_gzip else served_file.etag
+        headers = {"ETag": etag, "Cache-Control": served_file.cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None and (if_none_match.strip() == "*" or etag in [i.strip() for i in if_none_match.split(",")]):
+            self._send_empty(304, headers)
+            return
+        body = served_file.gzip_body if use_gzip else served_file.body
+        self.send_response(200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UpdateServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], snapshot: UpdateSnapshot, reload_interval: float, verbose: bool = False):
+        super().__init__(address, UpdateRequestHandler)
+        self.snapshot: UpdateSnapshot = snapshot
+        self.verbose: bool = verbose
+        self._reload_interval: float = reload_interval
+        self._stopped = threading.Event()
+
+    def _reload_loop(self):
+        while not self._stopped.wait(self._reload_interval):
+            self.snapshot.reload()
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        self.snapshot.reload()
+        reloader = threading.Thread(target=self._reload_loop, daemon=True)
+        reloader.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._stopped.set()
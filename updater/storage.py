@@ -0,0 +1,427 @@
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional, Union
+
+from .cache import VersionMetaCache
+from .catalog import VersionCatalog, ShardedVersionCatalog
+from .changelog import change_log_hash
+from .model import DownloadSource, VersionInfo, VersionIndex, VersionCompat
+from .utils import load_json, prepare_parent_dir
+
+
+class VersionStore(ABC):
+    # Whether the Version/<code> files are the records themselves rather than an export of them
+    materialized: bool = False
+
+    @abstractmethod
+    def versions(self, descending: bool = True) -> list[int]:
+        pass
+
+    @abstractmethod
+    def top(self, num: int) -> list[int]:
+        pass
+
+    @abstractmethod
+    def newer_count(self, version_code: int) -> int:
+        pass
+
+    @abstractmethod
+    def latest(self) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def pages(self, page_size: int) -> Iterator[list[int]]:
+        pass
+
+    @abstractmethod
+    def __contains__(self, version_code: int) -> bool:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, version_code: int) -> Optional[VersionInfo]:
+        pass
+
+    @abstractmethod
+    def get_index(self, version_code: int) -> Optional[VersionIndex]:
+        pass
+
+    @abstractmethod
+    def change_log_hash(self, version_code: int) -> Optional[str]:
+        # The change log blob a version file references, None when it keeps its change log inline; stores that are not
+        # materialized answer for every version, as their exports follow the product's slim setting
+        pass
+
+    @abstractmethod
+    def compats(self) -> list[tuple[int, VersionCompat]]:
+        pass
+
+    @abstractmethod
+    def put(self, info: VersionInfo, exported: bool = False) -> bool:
+        pass
+
+    @abstractmethod
+    def remove(self, version_code: int) -> bool:
+        pass
+
+    def unexported(self) -> list[VersionInfo]:
+        return []
+
+    def removed(self) -> list[int]:
+        return []
+
+    def mark_exported(self, version_codes: list[int], removed_codes: list[int]):
+        pass
+
+    def mark_all_unexported(self):
+        pass
+
+    def retain(self, version_codes: list[int]):
+        pass
+
+    def stamp(self, path: str) -> Optional[tuple]:
+        return None
+
+    def sync(self, stamp: Optional[tuple]):
+        pass
+
+    def invalidate(self):
+        pass
+
+    def revalidate(self):
+        pass
+
+    def save(self):
+        pass
+
+
+class FileVersionStore(VersionStore):
+    materialized = True
+
+    def __init__(
+        self,
+        catalog: Union[VersionCatalog, ShardedVersionCatalog],
+        version_file: Callable[[int], str],
+        meta_cache_path: str,
+        change_log_loader: Callable[[str], str],
+        slim_versions: Callable[[], bool],
+    ):
+        self._catalog: Union[VersionCatalog, ShardedVersionCatalog] = catalog
+        self._version_file: Callable[[int], str] = version_file
+        self._change_log_loader: Callable[[str], str] = change_log_loader
+        self._slim_versions: Callable[[], bool] = slim_versions
+        self._meta_cache: VersionMetaCache = VersionMetaCache(meta_cache_path)
+
+    def versions(self, descending: bool = True) -> list[int]:
+        return self._catalog.versions(descending)
+
+    def top(self, num: int) -> list[int]:
+        return self._catalog.top(num)
+
+    def newer_count(self, version_code: int) -> int:
+        return self._catalog.newer_count(version_code)
+
+    def latest(self) -> Optional[int]:
+        return self._catalog.latest()
+
+    def pages(self, page_size: int) -> Iterator[list[int]]:
+        return self._catalog.pages(page_size)
+
+    def __contains__(self, version_code: int) -> bool:
+        return version_code in self._catalog
+
+    def __len__(self) -> int:
+        return len(self._catalog)
+
+    def get(self, version_code: int) -> Optional[VersionInfo]:
+        version_file = self._version_file(version_code)
+        if os.path.exists(version_file):
+            data = load_json(version_file)
+            info = VersionInfo.from_dict(data, change_log_loader=self._change_log_loader)
+            self._meta_cache.put(info, os.stat(version_file), "changeLog" not in data)
+            return info
+        else:
+            return None
+
+    def _load_meta(self, version_code: int, stat: os.stat_result) -> tuple[VersionIndex, Optional[str], VersionCompat]:
+        # Only the header fields are decoded, so a slim version never pulls in its change log blob
+        data = load_json(self._version_file(version_code))
+        index = VersionIndex.from_version_dict(data)
+        hash_value = data.get("changeLogHash") if "changeLog" not in data else None
+        compat = VersionCompat.from_dict(data)
+        self._meta_cache.put_meta(index, data.get("versionName"), hash_value, compat, stat)
+        return index, hash_value, compat
+
+    def _stat(self, version_code: int) -> Optional[os.stat_result]:
+        try:
+            return os.stat(self._version_file(version_code))
+        except FileNotFoundError:
+            return None
+
+    def get_index(self, version_code: int) -> Optional[VersionIndex]:
+        stat = self._stat(version_code)
+        if stat is None:
+            return None
+        index = self._meta_cache.get_index(version_code, stat)
+        return index if index is not None else self._load_meta(version_code, stat)[0]
+
+    def change_log_hash(self, version_code: int) -> Optional[str]:
+        stat = self._stat(version_code)
+        if stat is None:
+            return None
+        entry = self._meta_cache.get(version_code, stat)
+        return entry.get("changeLogHash") if entry is not None else self._load_meta(version_code, stat)[1]
+
+    def compats(self) -> list[tuple[int, VersionCompat]]:
+        compats = []
+        for version_code in self._catalog.versions():
+            stat = self._stat(version_code)
+            if stat is not None:
+                compat = self._meta_cache.get_compat(version_code, stat)
+                compats.append((version_code, compat if compat is not None else self._load_meta(version_code, stat)[2]))
+        return compats
+
+    def put(self, info: VersionInfo, exported: bool = False) -> bool:
+        # The file itself has already been written by UpdateFileManager
+        self._catalog.add(info.version_code)
+        self._meta_cache.put(info, os.stat(self._version_file(info.version_code)), self._slim_versions())
+        return True
+
+    def remove(self, version_code: int) -> bool:
+        self._catalog.remove(version_code)
+        self._meta_cache.remove(version_code)
+        return True
+
+    def retain(self, version_codes: list[int]):
+        self._meta_cache.retain(version_codes)
+
+    def stamp(self, path: str) -> Optional[tuple]:
+        return self._catalog.stamp(path)
+
+    def sync(self, stamp: Optional[tuple]):
+        self._catalog.sync(stamp)
+
+    def invalidate(self):
+        self._catalog.invalidate()
+
+    def revalidate(self):
+        # Folder mtimes are too coarse to notice every write from another process
+        self._catalog.invalidate()
+        self._meta_cache.revalidate()
+
+    def save(self):
+        self._meta_cache.save()
+
+
+class SqliteVersionStore(VersionStore):
+    _INFO_COLUMNS = "version_code, version_name, force_update, change_log, min_sdk, abis, channel"
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS versions (
+            product_id INTEGER NOT NULL REFERENCES products (id) ON DELETE CASCADE,
+            version_code INTEGER NOT NULL,
+            version_name TEXT NOT NULL,
+            force_update INTEGER NOT NULL,
+            change_log TEXT NOT NULL,
+            min_sdk INTEGER,
+            abis TEXT NOT NULL DEFAULT '',
+            channel TEXT,
+            exported INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, version_code)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS versions_unexported ON versions (product_id, version_code) WHERE exported = 0;
+        CREATE TABLE IF NOT EXISTS download_sources (
+            product_id INTEGER NOT NULL,
+            version_code INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            source_name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            is_direct_link INTEGER NOT NULL,
+            size INTEGER,
+            sha256 TEXT,
+            PRIMARY KEY (product_id, version_code, position),
+            FOREIGN KEY (product_id, version_code) REFERENCES versions (product_id, version_code) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS removed_versions (
+            product_id INTEGER NOT NULL REFERENCES products (id) ON DELETE CASCADE,
+            version_code INTEGER NOT NULL,
+            PRIMARY KEY (product_id, version_code)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, database_path: str, product: str):
+        prepare_parent_dir(database_path)
+        self._connection: sqlite3.Connection = sqlite3.connect(database_path, timeout=30)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(self._SCHEMA)
+        self._migrate()
+        self._connection.commit()
+        self._product: str = product
+        # The product row is only added with its first version, so a failed import leaves no trace of the product behind
+        self._product_id: Optional[int] = self._find_product_id()
+
+    def _find_product_id(self) -> Optional[int]:
+        row = self._connection.execute("SELECT id FROM products WHERE name = ?", (self._product,)).fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def has_product(database_path: str, product: str) -> bool:
+        if not os.path.exists(database_path):
+            return False
+        connection = sqlite3.connect(database_path, timeout=30)
+        try:
+            sql = "SELECT 1 FROM versions JOIN products ON products.id = versions.product_id WHERE products.name = ? LIMIT 1"
+            return connection.execute(sql, (product,)).fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            connection.close()
+
+    def _migrate(self):
+        added_columns = {
+            "versions": [("min_sdk", "INTEGER"), ("abis", "TEXT NOT NULL DEFAULT ''"), ("channel", "TEXT")],
+            "download_sources": [("size", "INTEGER"), ("sha256", "TEXT")],
+        }
+        for table, definitions in added_columns.items():
+            columns = {i[1] for i in self._connection.execute(f"PRAGMA table_info({table})")}
+            for column, definition in definitions:
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @staticmethod
+    def _compat(min_sdk: Optional[int], abis: str, channel: Optional[str]) -> VersionCompat:
+        return VersionCompat(min_sdk=min_sdk, abis=tuple(abis.split(",")) if len(abis) > 0 else (), channel=channel)
+
+    def _codes(self, sql: str, *params) -> list[int]:
+        return [i[0] for i in self._connection.execute(sql, (self._product_id, *params))]
+
+    def versions(self, descending: bool = True) -> list[int]:
+        return self._codes(f"SELECT version_code FROM versions WHERE product_id = ? ORDER BY version_code {'DESC' if descending else 'ASC'}")
+
+    def top(self, num: int) -> list[int]:
+        return self._codes("SELECT version_code FROM versions WHERE product_id = ? ORDER BY version_code DESC LIMIT ?", num)
+
+    def newer_count(self, version_code: int) -> int:
+        sql = "SELECT COUNT(*) FROM versions WHERE product_id = ? AND version_code > ?"
+        return self._connection.execute(sql, (self._product_id, version_code)).fetchone()[0]
+
+    def latest(self) -> Optional[int]:
+        return self._connection.execute("SELECT MAX(version_code) FROM versions WHERE product_id = ?", (self._product_id,)).fetchone()[0]
+
+    def pages(self, page_size: int) -> Iterator[list[int]]:
+        last_code = None
+        while True:
+            if last_code is None:
+                page = self._codes("SELECT version_code FROM versions WHERE product_id = ? ORDER BY version_code LIMIT ?", page_size)
+            else:
+                sql = "SELECT version_code FROM versions WHERE product_id = ? AND version_code > ? ORDER BY version_code LIMIT ?"
+                page = self._codes(sql, last_code, page_size)
+            if len(page) == 0:
+                return
+            yield page
+            last_code = page[-1]
+
+    def __contains__(self, version_code: int) -> bool:
+        sql = "SELECT 1 FROM versions WHERE product_id = ? AND version_code = ?"
+        return self._connection.execute(sql, (self._product_id, version_code)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM versions WHERE product_id = ?", (self._product_id,)).fetchone()[0]
+
+    def _version_info(self, row: tuple) -> VersionInfo:
+        version_code, version_name, force_update, change_log, min_sdk, abis, channel = row
+        sources = self._connection.execute(
+            "SELECT source_name, url, is_direct_link, size, sha256 FROM download_sources WHERE product_id = ? AND version_code = ? ORDER BY position",
+            (self._product_id, version_code),
+        )
+        return VersionInfo(
+            version_code=version_code,
+            version_name=version_name,
+            force_update=bool(force_update),
+            change_log=change_log,
+            download_source=tuple(DownloadSource(source_name=i[0], url=i[1], is_direct_link=bool(i[2]), size=i[3], sha256=i[4]) for i in sources),
+            compat=self._compat(min_sdk, abis, channel),
+        )
+
+    def get(self, version_code: int) -> Optional[VersionInfo]:
+        row = self._connection.execute(
+            f"SELECT {self._INFO_COLUMNS} FROM versions WHERE product_id = ? AND version_code = ?",
+            (self._product_id, version_code),
+        ).fetchone()
+        return self._version_info(row) if row is not None else None
+
+    def get_index(self, version_code: int) -> Optional[VersionIndex]:
+        sql = "SELECT force_update FROM versions WHERE product_id = ? AND version_code = ?"
+        row = self._connection.execute(sql, (self._product_id, version_code)).fetchone()
+        return VersionIndex(version=version_code, force_update=bool(row[0])) if row is not None else None
+
+    def change_log_hash(self, version_code: int) -> Optional[str]:
+        sql = "SELECT change_log FROM versions WHERE product_id = ? AND version_code = ?"
+        row = self._connection.execute(sql, (self._product_id, version_code)).fetchone()
+        return change_log_hash(row[0]) if row is not None else None
+
+    def compats(self) -> list[tuple[int, VersionCompat]]:
+        rows = self._connection.execute(
+            "SELECT version_code, min_sdk, abis, channel FROM versions WHERE product_id = ? ORDER BY version_code DESC", (self._product_id,)
+        )
+        return [(i[0], self._compat(*i[1:])) for i in rows]
+
+    def put(self, info: VersionInfo, exported: bool = False) -> bool:
+        if not exported and self.get(info.version_code) == info:
+            return False
+        if self._product_id is None:
+            self._connection.execute("INSERT OR IGNORE INTO products (name) VALUES (?)", (self._product,))
+            self._product_id = self._find_product_id()
+        compat = info.compat
+        self._connection.execute(
+            "INSERT OR REPLACE INTO versions (product_id, version_code, version_name, force_update, change_log, min_sdk, abis, channel, exported) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self._product_id, info.version_code, info.version_name, info.force_update, info.change_log, compat.min_sdk, ",".join(compat.abis), compat.channel, exported),
+        )
+        self._connection.execute("DELETE FROM download_sources WHERE product_id = ? AND version_code = ?", (self._product_id, info.version_code))
+        self._connection.executemany(
+            "INSERT INTO download_sources (product_id, version_code, position, source_name, url, is_direct_link, size, sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(self._product_id, info.version_code, i, v.source_name, v.url, v.is_direct_link, v.size, v.sha256) for i, v in enumerate(info.download_source)],
+        )
+        self._connection.execute("DELETE FROM removed_versions WHERE product_id = ? AND version_code = ?", (self._product_id, info.version_code))
+        return True
+
+    def remove(self, version_code: int) -> bool:
+        params = (self._product_id, version_code)
+        if self._connection.execute("DELETE FROM versions WHERE product_id = ? AND version_code = ?", params).rowcount == 0:
+            return False
+        self._connection.execute("INSERT OR IGNORE INTO removed_versions (product_id, version_code) VALUES (?, ?)", params)
+        return True
+
+    def unexported(self) -> list[VersionInfo]:
+        rows = self._connection.execute(
+            f"SELECT {self._INFO_COLUMNS} FROM versions WHERE product_id = ? AND exported = 0 ORDER BY version_code",
+            (self._product_id,),
+        ).fetchall()
+        return [self._version_info(i) for i in rows]
+
+    def removed(self) -> list[int]:
+        return self._codes("SELECT version_code FROM removed_versions WHERE product_id = ? ORDER BY version_code")
+
+    def mark_exported(self, version_codes: list[int], removed_codes: list[int]):
+        self._connection.executemany("UPDATE versions SET exported = 1 WHERE product_id = ? AND version_code = ?", [(self._product_id, i) for i in version_codes])
+        self._connection.executemany("DELETE FROM removed_versions WHERE product_id = ? AND version_code = ?", [(self._product_id, i) for i in removed_codes])
+
+    def mark_all_unexported(self):
+        self._connection.execute("UPDATE versions SET exported = 0 WHERE product_id = ?", (self._product_id,))
+
+    def revalidate(self):
+        if self._product_id is None:
+            # Another process may have added the first version meanwhile
+            self._product_id = self._find_product_id()
+
+    def save(self):
+        self._connection.commit()
@@ -0,0 +1,105 @@
+import os
+import json
+import tempfile
+from typing import Union
+
+from .profiler import profiled
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@profiled("list")
+def list_jsons(folder_path: str) -> list[str]:
+    return sorted(
+        [i for i in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, i)) and i.endswith(".json") and not i.startswith(".")]
+    )
+
+
+@profiled("read", size=lambda data, *_: len(data))
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@profiled("json.load")
+def load_json(path: str) -> Union[dict, list]:
+    data = read_bytes(path)
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _get_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_FILE_MODE = _get_file_mode()
+
+
+def is_same_content(path: str, data: bytes) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return os.fstat(f.fileno()).st_size == len(data) and f.read() == data
+    except FileNotFoundError:
+        return False
+
+
+@profiled("write", size=lambda changed, _, data: len(data) if changed else 0, written=True)
+def write_bytes(path: str, data: bytes) -> bool:
+    if is_same_content(path, data):
+        return False
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, _FILE_MODE)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return True
+
+
+@profiled("link")
+def link_file(source: str, target: str) -> bool:
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return False
+    temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.link")
+    remove_file(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        # Filesystems without hard links get a copy, which is rewritten whenever the source changes
+        return write_bytes(target, read_bytes(source))
+    os.replace(temp_path, target)
+    return True
+
+
+@profiled("json.dump")
+def serialize_json(content: Union[dict, list]) -> bytes:
+    return json.dumps(content).encode("utf-8")
+
+
+def dump_json(path: str, content: Union[dict, list]) -> bool:
+    return write_bytes(path, serialize_json(content))
+
+
+@profiled("remove")
+def remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+@profiled("makedirs")
+def prepare_parent_dir(path: str):
+    parent_dir = os.path.dirname(path)
+    if not parent_dir.isspace() or len(parent_dir) == 0:
+        if not os.path.exists(parent_dir):
+            # Concurrent writers may create the same directory between the check and makedirs
+            os.makedirs(parent_dir, exist_ok=True)
@@ -1,3 +1,4 @@
+import sys
 from typing import Optional, Callable
 
 from .meta import __author__, __version__, __website__
@@ -42,11 +43,12 @@ class UpdateViewMenus:
         on_list_versions: Callable[[], None],
         on_add_version: Callable[[], None],
         on_replace_version: Callable[[], None],
+        on_add_all_versions: Callable[[], None],
         on_delete_version: Callable[[], None],
         on_refresh_all: Callable[[], None],
     ):
-        sections = ["List versions", "Add version", "Replace version", "Delete version", "Refresh all"]
-        actions = [on_list_versions, on_add_version, on_replace_version, on_delete_version, on_refresh_all]
+        sections = ["List versions", "Add version", "Replace version", "Add all version templates", "Delete version", "Refresh all"]
+        actions = [on_list_versions, on_add_version, on_replace_version, on_add_all_versions, on_delete_version, on_refresh_all]
         while True:
             choice = UpdateViewMenus._choose_ui(f"Current Product: {product}", sections)
             if choice is not None:
@@ -136,6 +138,11 @@ class UpdateViewInputs:
     def validate_delete_version(version_code: int, version_name: str) -> bool:
         return UpdateViewInputs._yes_or_no(f"Are you sure to delete '{version_name}' ({version_code})", False)
 
+    @staticmethod
+    def validate_add_version_templates(count: int, path: str, replaceable: bool) -> bool:
+        action = "replace" if replaceable else "add"
+        return UpdateViewInputs._yes_or_no(f"Are you sure to {action} all {count} version templates in '{path}'", False)
+
     @staticmethod
     def validate_replace_version(version_code_new: int, version_name_new: str, version_code: int, version_name: str) -> bool:
         return UpdateViewInputs._yes_or_no(
@@ -168,14 +175,25 @@ class UpdateViewOutputs:
             print("Total:", len(versions))
 
     @staticmethod
-    def show_products(products: list[str]):
-        if len(products) == 0:
+    def show_archive_ranges(ranges: list[dict]):
+        print("Archived:")
+        for i in ranges:
+            print(f"{i['first']}-{i['last']}\t{i['count']}")
+        print("Total archived:", sum(i["count"] for i in ranges))
+
+    @staticmethod
+    def show_products(summaries: list[dict]):
+        if len(summaries) == 0:
             print("No products available!")
         else:
             print("Products:")
-            for product in products:
-                print(f"  {product}")
-            print("Total:", len(products))
+            for i in summaries:
+                if i["latestVersionCode"] is None:
+                    print(f"  {i['product']}\tNo versions")
+                else:
+                    force_update = "\tForce update" if i["forceUpdate"] else ""
+                    print(f"  {i['product']}\t{i['latestVersionCode']} ({i['latestVersionName']})\tVersions: {i['versionCount']}{force_update}")
+            print("Total:", len(summaries))
 
     @staticmethod
     def new_version_template_created(path: str):
@@ -197,6 +215,10 @@ class UpdateViewOutputs:
     def same_version_code_exists(version_code: int):
         print(f"Same version code {version_code} exists!")
 
+    @staticmethod
+    def version_add_rejected(version_code: int):
+        print(f"Version code {version_code} not added: another writer added the same or a newer version meanwhile!")
+
     @staticmethod
     def new_version_added(version_code: int, version_name: str):
         print(f"New version '{version_name}' ({version_code}) added!")
@@ -205,6 +227,26 @@ class UpdateViewOutputs:
     def new_version_replaced(version_code: int, version_name: str):
         print(f"New version '{version_name}' ({version_code}) replaced!")
 
+    @staticmethod
+    def invalid_version_template(name: str, error: Exception):
+        print(f"Version template '{name}' is invalid: {error}")
+
+    @staticmethod
+    def duplicate_version_template(name: str, other_name: str, version_code: int):
+        print(f"Version template '{name}' has the same version code {version_code} as '{other_name}'!")
+
+    @staticmethod
+    def no_version_templates(path: str):
+        print(f"No version templates in '{path}'!")
+
+    @staticmethod
+    def version_template_prefix(name: str):
+        print(f"Version template '{name}':", end=" ")
+
+    @staticmethod
+    def version_templates_summary(committed: int, failed: int):
+        print(f"Version templates committed: {committed}, failed: {failed}")
+
     @staticmethod
     def version_deleted(version_code: int, version_name: str):
         print(f"Version '{version_name}' ({version_code}) deleted!")
@@ -221,3 +263,67 @@ class UpdateViewOutputs:
     def all_refreshed():
         UpdateViewOutputs.index_refreshed()
         UpdateViewOutputs.latest_refreshed()
+
+    @staticmethod
+    def files_changed(count: int):
+        print(f"Files changed: {count}")
+
+    @staticmethod
+    def product_refreshed(product: str):
+        print(f"Product '{product}' refreshed!")
+
+    @staticmethod
+    def product_refresh_failed(product: str, error: BaseException):
+        print(f"Product '{product}' refresh failed: {error!r}")
+
+    @staticmethod
+    def products_refresh_summary(refreshed: int, failed: int):
+        print(f"Products refreshed: {refreshed}, failed: {failed}")
+
+    @staticmethod
+    def product_exported(product: str):
+        print(f"Product '{product}' exported!")
+
+    @staticmethod
+    def product_migrated(product: str, imported: int):
+        print(f"Product '{product}' migrated: {imported} versions imported")
+
+    @staticmethod
+    def product_resharded(product: str, moved: int):
+        print(f"Product '{product}' resharded: {moved} version files moved")
+
+    @staticmethod
+    def product_compacted(product: str, archived: int):
+        print(f"Product '{product}' compacted: {archived} versions archived")
+
+    @staticmethod
+    def product_migrate_failed(product: str, error: BaseException):
+        print(f"Product '{product}' migrate failed: {error}")
+
+    @staticmethod
+    def profile_summary(summary: dict):
+        lines = [
+            f"Profile: {summary['wall_time'] * 1000:.2f} ms",
+            f"Files read: {summary['files_read']} ({summary['bytes_read']} bytes)",
+            f"Files written: {summary['files_written']} ({summary['bytes_written']} bytes)",
+        ]
+        for name, stats in summary["operations"].items():
+            lines.append(f"{name:<48} {stats['count']:>8} {stats['seconds'] * 1000:10.2f} ms")
+        sys.stderr.write("\n".join(lines) + "\n")
+
+    @staticmethod
+    def watch_started(backend: str, folders: list[str]):
+        print(f"Watching with {backend}:")
+        for folder in folders:
+            print(f"  {folder}")
+        UpdateViewOutputs.hint_exit()
+
+    @staticmethod
+    def serve_started(host: str, port: int):
+        print(f"Serving updates on http://{host}:{port}/")
+        UpdateViewOutputs.hint_exit()
+
+    @staticmethod
+    def daemon_started(socket_path: str):
+        print(f"Daemon listening on '{socket_path}'")
+        UpdateViewOutputs.hint_exit()
@@ -0,0 +1,73 @@
+import os
+import time
+from typing import Union
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class PollingFolderWatcher:
+    name = "polling"
+
+    def __init__(self, content_folders: list[str], mtime_folders: list[str], interval: float):
+        self._content_folders: list[str] = content_folders
+        self._mtime_folders: list[str] = mtime_folders
+        self._interval: float = interval
+        self._snapshot: dict[str, Union[int, tuple[int, int]]] = self._scan()
+
+    def _scan(self) -> dict[str, Union[int, tuple[int, int]]]:
+        snapshot = {}
+        for folder in self._content_folders:
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+        for folder in self._mtime_folders:
+            try:
+                snapshot[folder] = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return snapshot
+
+    def wait(self, timeout: float) -> set[str]:
+        time.sleep(min(timeout, self._interval))
+        snapshot = self._scan()
+        changed = {i for i in snapshot.keys() | self._snapshot.keys() if snapshot.get(i) != self._snapshot.get(i)}
+        self._snapshot = snapshot
+        return {i if i in self._mtime_folders else os.path.dirname(i) for i in changed}
+
+    def reset(self):
+        self._snapshot = self._scan()
+
+
+class InotifyFolderWatcher:
+    name = "inotify"
+
+    def __init__(self, folders: list[str]):
+        flags = inotify_simple.flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.CREATE | flags.DELETE
+        self._inotify = inotify_simple.INotify()
+        self._watches: dict[int, str] = {self._inotify.add_watch(i, mask): i for i in folders}
+
+    def wait(self, timeout: float) -> set[str]:
+        return {self._watches[i.wd] for i in self._inotify.read(timeout=int(timeout * 1000)) if i.wd in self._watches}
+
+    def reset(self):
+        self._inotify.read(timeout=0)
+
+
+def create_folder_watcher(
+    content_folders: list[str], mtime_folders: list[str], interval: float, polling: bool
+) -> Union[InotifyFolderWatcher, PollingFolderWatcher]:
+    if inotify_simple is not None and not polling:
+        try:
+            return InotifyFolderWatcher(content_folders + mtime_folders)
+        except OSError:
+            pass
+    return PollingFolderWatcher(content_folders, mtime_folders, interval)